@@ -21,6 +21,66 @@ from pathlib import Path
 import shutil
 
 from .pyluxcore import *
+from ._assets import (
+    AssetTiming,
+    LoadReport,
+    scene_assets,
+    prefetch_assets,
+    load_scene,
+    load_render_config,
+)
+from ._cache import (
+    AssetCache,
+    enable_asset_cache,
+    disable_asset_cache,
+    asset_cache,
+)
+from ._checkpoint import (
+    CheckpointInfo,
+    Checkpointer,
+    checkpoint_info,
+    checkpoint_config,
+    scan_checkpoints,
+    load_checkpoint,
+    resume_checkpoint,
+    restore_checkpoint,
+    read_checkpoint_header,
+)
+from ._denoise import denoise, release_denoiser
+from ._display import convert_to_display
+from ._edit import EditReport, SceneEdit
+from ._film import DirtyTiles, FilmOutputs, output_dtype
+from ._imageio import save_image
+from ._merge import merge_films, stream_merge_films
+from ._ply import read_ply
+from ._pipeline import PipelineCache, pipeline_properties, parse_pipeline
+from ._progress import (
+    pass_count,
+    convergence,
+    halt_time,
+    any_of,
+    wait_for,
+    progress,
+)
+from ._properties import (
+    add_all_float,
+    add_all_int,
+    add_all_uint,
+    add_all_bool,
+    get_all_float,
+    get_all_int,
+    get_all_uint,
+    get_all_bool,
+    PropertiesIndex,
+)
+from ._properties_binary import save_properties_binary, load_properties_binary
+from ._scene import (
+    define_mesh,
+    define_strands,
+    define_instances,
+    to_luxcore_matrix,
+)
+from ._scheduler import RenderJob, SessionScheduler
 
 _LUXFOLDER = Path(pyluxcore.__file__).parent
 
@@ -0,0 +1,191 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Scene loading with concurrent asset prefetching and caching."""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import time
+
+from .pyluxcore import Properties, RenderConfig, Scene
+from ._cache import asset_cache
+from ._ply import read_ply
+from ._properties import PropertiesIndex
+from ._scene import define_mesh
+
+# Scene properties holding the path of an external asset
+_ASSET_KEY = re.compile(
+    r"^scene\.(?:shapes|objects)\.[^.]+\.ply$"
+    r"|^scene\.(?:textures|lights|volumes)\.[^.]+\.(?:file|iesfile)$"
+)
+
+# Configuration properties applied by LuxCore when it builds the scene
+_IMAGE_OPTIONS = ("images.scale", "scene.images.resizepolicy.")
+
+_READ_CHUNK = 1 << 22
+
+AssetTiming = namedtuple("AssetTiming", ["path", "size", "seconds"])
+AssetTiming.__doc__ = "Load time of an asset file (size in bytes, None if missing)."
+
+LoadReport = namedtuple("LoadReport", ["assets", "prefetch", "parse"])
+LoadReport.__doc__ = """Timings of a scene load, in seconds.
+
+assets: AssetTiming of each asset, prefetch: wall time of the concurrent
+asset prefetch, parse: time spent by LuxCore building the scene.
+"""
+
+
+def scene_assets(props):
+    """Return the asset file paths referenced by scene properties.
+
+    Paths are returned as written in the properties, without duplicates,
+    in definition order.
+    """
+    paths = {}
+    for name in props.GetAllNames("scene."):
+        if _ASSET_KEY.match(name):
+            paths.setdefault(props.Get(name).GetString(), None)
+    return list(paths)
+
+
+def _read_asset(path):
+    start = time.perf_counter()
+    try:
+        size = 0
+        buffer = bytearray(_READ_CHUNK)
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                size += count
+    except OSError:
+        size = None
+    return AssetTiming(path, size, time.perf_counter() - start)
+
+
+def prefetch_assets(paths, threads=None, reader=_read_asset):
+    """Read asset files concurrently, return their AssetTiming list.
+
+    Reading the files ahead of scene parsing brings them into the
+    operating system cache, overlapping their I/O latencies. This only
+    shortens loading when the files are not cached yet (cold cache,
+    network file systems): decoding is still done by the scene parser,
+    so on a warm cache the files are just read twice. Missing files are
+    reported with a None size and left to the scene parser.
+    """
+    if not paths:
+        return []
+    if threads is None:
+        threads = min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(
+        max_workers=threads, thread_name_prefix="pyluxcore-assets"
+    ) as executor:
+        return list(executor.map(reader, paths))
+
+
+def _read_ply_detached(path):
+    # Cached meshes must not be views on the file, which may be rewritten
+    return read_ply(path, mmap=False)
+
+
+def _plain_meshes(props):
+    # Shapes only made of "type = mesh" and "ply = <path>": {shape: path}
+    index = PropertiesIndex(props)
+    meshes = {}
+    for shape in index.unique_sub_names("scene.shapes"):
+        names = index.names(shape + ".")
+        if (
+            sorted(names) == [shape + ".ply", shape + ".type"]
+            and props.Get(shape + ".type").GetString() == "mesh"
+        ):
+            meshes[shape] = props.Get(shape + ".ply").GetString()
+    return meshes
+
+
+def load_scene(scene, threads=None, cache=None, decode_meshes=False):
+    """Load a scene, prefetching its assets concurrently.
+
+    `scene` is a scene file path (.scn) or a Properties object. Assets
+    are prefetched (see prefetch_assets), then decoded by LuxCore.
+    Return the Scene and a LoadReport.
+
+    With `decode_meshes`, PLY meshes of plain mesh shapes are instead
+    decoded concurrently in Python, through `cache` or the process-wide
+    asset cache (see enable_asset_cache), and defined from arrays. This
+    is a trade-off, off by default: define_mesh hands the arrays to
+    LuxCore as Python tuple lists, which costs more time and peak memory
+    than the native PLY loader on large meshes, and only pays off when
+    the same meshes are loaded repeatedly from the cache. Compare the
+    "ply.loadscene.*" rows of the ply bench suite on your meshes.
+    Textures and other assets are never cached.
+    """
+    props = scene
+    if isinstance(props, (str, os.PathLike)):
+        props = Properties(os.fspath(props))
+    if cache is None and decode_meshes:
+        cache = asset_cache()
+    meshes = _plain_meshes(props) if decode_meshes and cache is not None else {}
+    mesh_paths = set(meshes.values())
+    decoded = {}
+
+    def reader(path):
+        if path not in mesh_paths:
+            return _read_asset(path)
+        start = time.perf_counter()
+        try:
+            decoded[path] = cache.get(path, _read_ply_detached)
+        except (OSError, ValueError):
+            # Left to LuxCore, which reports errors in its own way
+            return _read_asset(path)
+        return AssetTiming(path, os.path.getsize(path), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    assets = prefetch_assets(scene_assets(props), threads, reader)
+    prefetch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = Scene()
+    meshes = {s: p for s, p in meshes.items() if p in decoded}
+    if meshes:
+        for shape, path in meshes.items():
+            define_mesh(result, shape[len("scene.shapes.") :], **decoded[path])
+        skipped = set()
+        for shape in meshes:
+            skipped.update((shape + ".type", shape + ".ply"))
+        remaining = Properties()
+        for name in props.GetAllNames():
+            if name not in skipped:
+                remaining.Set(props.Get(name))
+        props = remaining
+    result.Parse(props)
+    parse = time.perf_counter() - start
+    return result, LoadReport(assets, prefetch, parse)
+
+
+def load_render_config(config, threads=None, cache=None, decode_meshes=False):
+    """Load a render configuration and its scene (see load_scene).
+
+    `config` is a configuration file path (.cfg) or a Properties object,
+    whose "scene.file" property gives the scene file. If the
+    configuration scales image maps ("images.scale" or
+    "scene.images.resizepolicy.*"), the scene is built by RenderConfig,
+    which applies these settings, after the asset prefetch. Return the
+    RenderConfig and a LoadReport.
+    """
+    if isinstance(config, (str, os.PathLike)):
+        config = Properties(os.fspath(config))
+    scene_file = config.Get("scene.file").GetString()
+    if not any(config.GetAllNames(prefix) for prefix in _IMAGE_OPTIONS):
+        scene, report = load_scene(scene_file, threads, cache, decode_meshes)
+        return RenderConfig(config, scene), report
+
+    start = time.perf_counter()
+    assets = prefetch_assets(scene_assets(Properties(scene_file)), threads)
+    prefetch = time.perf_counter() - start
+    start = time.perf_counter()
+    result = RenderConfig(config)
+    return result, LoadReport(assets, prefetch, time.perf_counter() - start)
@@ -0,0 +1,188 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Process-wide, content-addressed cache of decoded assets."""
+
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+_HASH_CHUNK = 1 << 22
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _nbytes(value):
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return len(value)
+
+
+class AssetCache:
+    """LRU cache of decoded asset files, bounded by a byte budget.
+
+    Entries are keyed by the content hash of the file and by the decoder
+    name, so that identical files share one entry. Hashes are remembered
+    per (path, mtime, size), so unchanged files are hashed once.
+
+    If `cache_dir` is given, decoded values made of numpy arrays (dicts
+    of arrays, such as read_ply results) are also stored there as .npy
+    files, and reloaded memory-mapped by later processes instead of
+    being decoded again.
+    """
+
+    def __init__(self, budget=1 << 30, cache_dir=None):
+        self.budget = budget
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path):
+        """Return the content hash of a file."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            hasher = hashlib.blake2b(digest_size=20)
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def get(self, path, decoder=_read_bytes):
+        """Return `decoder(path)`, from the cache if possible.
+
+        The default decoder returns the file content as bytes.
+        """
+        key = (self.digest(path), decoder.__name__)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = self._load_disk(key)
+        if value is None:
+            value = decoder(path)
+            self._save_disk(key, value)
+        else:
+            with self._lock:
+                self.disk_hits += 1
+        self._insert(key, value)
+        return value
+
+    def _insert(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._entries or size > self.budget:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, "%s-%s" % key)
+
+    def _load_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        folder = self._disk_path(key)
+        if not os.path.isdir(folder):
+            return None
+        return {
+            name[: -len(".npy")]: np.load(
+                os.path.join(folder, name), mmap_mode="r"
+            )
+            for name in os.listdir(folder)
+            if name.endswith(".npy")
+        }
+
+    def _save_disk(self, key, value):
+        if self.cache_dir is None or not isinstance(value, dict):
+            return
+        if not all(isinstance(v, np.ndarray) for v in value.values()):
+            return
+        folder = self._disk_path(key)
+        if os.path.isdir(folder):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write in a scratch folder, then rename, for concurrent processes
+        scratch = tempfile.mkdtemp(dir=self.cache_dir)
+        for name, array in value.items():
+            np.save(os.path.join(scratch, name + ".npy"), array)
+        try:
+            os.rename(scratch, folder)
+        except OSError:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def stats(self):
+        """Return cache counters as a dict."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size,
+                "budget": self.budget,
+            }
+
+    def clear(self):
+        """Drop all in-memory entries (the disk cache is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self.size = 0
+
+
+_ASSET_CACHE = None
+
+
+def enable_asset_cache(budget=1 << 30, cache_dir=None):
+    """Enable the process-wide asset cache and return it.
+
+    `budget` is the in-memory size limit in bytes; `cache_dir` an
+    optional folder for pre-decoded assets, shared across processes.
+    """
+    global _ASSET_CACHE
+    _ASSET_CACHE = AssetCache(budget, cache_dir)
+    return _ASSET_CACHE
+
+
+def disable_asset_cache():
+    """Disable and drop the process-wide asset cache."""
+    global _ASSET_CACHE
+    _ASSET_CACHE = None
+
+
+def asset_cache():
+    """Return the process-wide asset cache, None if disabled."""
+    return _ASSET_CACHE
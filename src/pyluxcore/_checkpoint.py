@@ -0,0 +1,312 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Compressed checkpoints of render sessions.
+
+A checkpoint is a resume file (see RenderSession.SaveResumeFile) split in
+fixed-size blocks, each compressed on its own.
+
+File layout, made to read metadata without decoding the rest:
+- magic (8 bytes), header length (uint64, little endian);
+- JSON header: pass count, render time, creation time, user metadata,
+  codec, block size, raw size, and lengths of the next two parts;
+- render configuration properties, as text;
+- JSON block table: stored size of each block;
+- the compressed blocks, in order.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from .pyluxcore import Properties, RenderConfig, RenderSession
+from ._progress import _fetch_stats
+
+_MAGIC = b"LXCKPT\x00\x00"
+_VERSION = 3
+_DEFAULT_BLOCK_SIZE = 1 << 20
+
+CheckpointInfo = namedtuple(
+    "CheckpointInfo", ["path", "passes", "time", "created", "metadata"]
+)
+CheckpointInfo.__doc__ = """Checkpoint summary, read from its header only.
+
+passes and time: pass count and render time (seconds) at checkpoint;
+created: creation timestamp.
+"""
+
+
+def _blosc():
+    try:
+        import blosc
+    except ImportError as err:
+        raise RuntimeError(
+            "The 'blosc' codec requires python-blosc (pip install blosc)"
+        ) from err
+    return blosc
+
+
+def _compress(codec, data, level):
+    if codec == "zlib":
+        return zlib.compress(data, 1 if level is None else level)
+    if codec == "blosc":
+        blosc = _blosc()
+        return blosc.compress(
+            bytes(data),
+            typesize=4,
+            clevel=5 if level is None else level,
+            cname="lz4",
+        )
+    raise ValueError("Unknown checkpoint codec: %s" % codec)
+
+
+def _decompress(codec, data):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "blosc":
+        return _blosc().decompress(data)
+    raise ValueError("Unknown checkpoint codec: %s" % codec)
+
+
+def _default_codec():
+    try:
+        _blosc()
+    except RuntimeError:
+        return "zlib"
+    return "blosc"
+
+
+def _read_header(f):
+    if f.read(8) != _MAGIC:
+        raise ValueError("Not a checkpoint file")
+    length = int.from_bytes(f.read(8), "little")
+    header = json.loads(f.read(length).decode("utf-8"))
+    if header["version"] != _VERSION:
+        raise ValueError("Unsupported checkpoint version")
+    return header
+
+
+def read_checkpoint_header(path):
+    """Return the header of a checkpoint file, as a dict.
+
+    Only the header is read, not the configuration nor the blocks.
+    """
+    with open(path, "rb") as f:
+        return _read_header(f)
+
+
+def checkpoint_info(path):
+    """Return the CheckpointInfo of a checkpoint file."""
+    header = read_checkpoint_header(path)
+    return CheckpointInfo(
+        path,
+        header["pass"],
+        header["time"],
+        header["created"],
+        header["metadata"],
+    )
+
+
+def scan_checkpoints(folder, prefix=""):
+    """Return the CheckpointInfo of the checkpoints of a folder.
+
+    Only headers are read. Checkpoints are sorted by creation time.
+    """
+    infos = []
+    for name in os.listdir(folder):
+        if name.startswith(prefix) and name.endswith(".lxc"):
+            try:
+                infos.append(checkpoint_info(os.path.join(folder, name)))
+            except (OSError, ValueError):
+                continue
+    infos.sort(key=lambda info: info.created)
+    return infos
+
+
+def _last_number(folder, prefix):
+    # Highest number of the "<prefix>-<number>.lxc" files of a folder
+    pattern = re.compile(re.escape(prefix) + r"-(\d+)\.lxc$")
+    numbers = [0]
+    for name in os.listdir(folder):
+        match = pattern.match(name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return max(numbers)
+
+
+def checkpoint_config(path):
+    """Return the render configuration Properties of a checkpoint.
+
+    Only the header and the configuration text are read.
+    """
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        text = f.read(header["config_length"]).decode("utf-8")
+    props = Properties()
+    props.SetFromString(text)
+    return props
+
+
+def restore_checkpoint(path, output):
+    """Decompress a checkpoint into a resume file (.rsm) at `output`."""
+    with open(path, "rb") as f, open(output, "wb") as out:
+        header = _read_header(f)
+        f.seek(header["config_length"], os.SEEK_CUR)
+        table = json.loads(f.read(header["blocks_length"]).decode("utf-8"))
+        for size in table["blocks"]:
+            out.write(_decompress(header["codec"], f.read(size)))
+    return output
+
+
+def load_checkpoint(path):
+    """Load a checkpoint, return (config, start state, start film).
+
+    The result can be given to RenderSession to resume rendering (see
+    RenderConfig.LoadResumeFile).
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        resume = restore_checkpoint(path, os.path.join(folder, "resume.rsm"))
+        return RenderConfig.LoadResumeFile(resume)
+
+
+def resume_checkpoint(path):
+    """Return a RenderSession resuming a checkpoint, not started yet.
+
+    The checkpoint is only decoded here: use checkpoint_info and
+    checkpoint_config to decide whether a checkpoint is worth resuming.
+    """
+    return RenderSession(*load_checkpoint(path))
+
+
+class Checkpointer:
+    """Periodic compressed checkpoints of a render session.
+
+    save() asks the session for a resume file, then compresses and
+    writes it on a background thread, so that rendering goes on during
+    compression and I/O. Checkpoints are written in `folder` as
+    "<prefix>-<number>.lxc", numbered after the highest number already
+    in the folder (from 1 in an empty folder), so that a resumed run does
+    not overwrite the checkpoints of the previous one.
+
+    - codec: "blosc" (requires python-blosc) or "zlib"; default is
+      blosc if available, zlib otherwise;
+    - level: compression level, codec default if None;
+    - keep: number of checkpoints kept; older checkpoints are deleted
+      (None keeps all).
+    """
+
+    def __init__(self, session, folder, prefix="checkpoint", codec=None,
+                 level=None, keep=1, block_size=_DEFAULT_BLOCK_SIZE):
+        self.session = session
+        self.folder = folder
+        self.prefix = prefix
+        self.codec = _default_codec() if codec is None else codec
+        self.level = level
+        self.keep = keep
+        self.block_size = block_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="pyluxcore-checkpoint"
+        )
+        self._history = []  # Paths of the written checkpoints
+        os.makedirs(folder, exist_ok=True)
+        self._count = _last_number(folder, prefix)
+        _compress(self.codec, b"", level)  # Fail early on a bad codec
+
+    def save(self, metadata=None):
+        """Start a checkpoint; return a Future of its path.
+
+        Only the resume file dump blocks the caller. `metadata`, a JSON
+        serializable dict, is stored in the checkpoint header.
+        """
+        stats = _fetch_stats(self.session)
+        passes = stats.Get("stats.renderengine.pass").GetInt()
+        fd, raw = tempfile.mkstemp(suffix=".rsm", dir=self.folder)
+        os.close(fd)
+        try:
+            self.session.SaveResumeFile(raw)
+        except BaseException:
+            os.remove(raw)
+            raise
+        self._count += 1
+        config = self.session.GetRenderConfig().GetProperties().ToString()
+        info = {
+            "pass": passes,
+            "time": stats.Get("stats.renderengine.time").GetFloat(),
+            "created": time.time(),
+            "metadata": metadata or {},
+        }
+        name = "%s-%06d.lxc" % (self.prefix, self._count)
+        return self._executor.submit(self._write, raw, name, info, config)
+
+    def _write(self, raw, name, info, config):
+        try:
+            with open(raw, "rb") as f:
+                data = f.read()
+        finally:
+            os.remove(raw)
+        view = memoryview(data)
+        payload = [
+            _compress(self.codec, view[start : start + self.block_size], self.level)
+            for start in range(0, len(data), self.block_size)
+        ]
+        config = config.encode("utf-8")
+        table = json.dumps({"blocks": [len(c) for c in payload]}).encode("utf-8")
+        header = dict(
+            info,
+            version=_VERSION,
+            codec=self.codec,
+            block_size=self.block_size,
+            size=len(data),
+            config_length=len(config),
+            blocks_length=len(table),
+        )
+        header = json.dumps(header).encode("utf-8")
+
+        path = os.path.join(self.folder, name)
+        scratch = path + ".tmp"
+        try:
+            with open(scratch, "wb") as f:
+                f.write(_MAGIC)
+                f.write(len(header).to_bytes(8, "little"))
+                f.write(header)
+                f.write(config)
+                f.write(table)
+                for compressed in payload:
+                    f.write(compressed)
+            os.replace(scratch, path)
+        finally:
+            if os.path.exists(scratch):
+                os.remove(scratch)
+
+        self._history.append(path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        if self.keep is None:
+            return
+        while len(self._history) > self.keep:
+            try:
+                os.remove(self._history.pop(0))
+            except OSError:
+                pass
+
+    def wait(self):
+        """Wait for pending checkpoints to be written."""
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        """Wait for pending checkpoints and release the writer thread."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""In-process denoising of numpy images with OpenImageDenoise.
+
+The OpenImageDenoise library bundled with pyluxcore is loaded with
+ctypes. One device is created on first use and kept, as well as one
+filter per input combination; calls into the library release the GIL.
+"""
+
+import ctypes
+import ctypes.util
+import glob
+from pathlib import Path
+import platform
+import threading
+
+import numpy as np
+
+_FOLDER = Path(__file__).parent
+
+# Folders and file patterns of the bundled library
+_LIBRARIES = {
+    "Linux": (("pyluxcore.oidn", "pyluxcore.libs"), "libOpenImageDenoise*.so*"),
+    "Windows": (("pyluxcore.libs",), "OpenImageDenoise*.dll"),
+    "Darwin": (("pyluxcore.oidn", "pyluxcore.libs"), "libOpenImageDenoise*.dylib"),
+}
+
+_DEVICE_TYPE_DEFAULT = 0
+_FORMAT_FLOAT3 = 3
+
+_LOCK = threading.Lock()
+_LIBRARY = None
+_DEVICE = None
+_FILTERS = {}  # (albedo, normal, hdr) -> filter
+
+
+def _find_library():
+    folders, pattern = _LIBRARIES[platform.system()]
+    for folder in folders:
+        folder = _FOLDER / ".." / folder
+        # Shortest name first: the main library, not its core or devices
+        matches = sorted(glob.glob(str(folder / pattern)), key=len)
+        if matches:
+            return matches[0]
+    return ctypes.util.find_library("OpenImageDenoise")
+
+
+def _load_library():
+    path = _find_library()
+    if path is None:
+        raise RuntimeError("OpenImageDenoise library not found")
+    lib = ctypes.CDLL(path)
+    handle = ctypes.c_void_p
+    lib.oidnNewDevice.restype = handle
+    lib.oidnNewDevice.argtypes = [ctypes.c_int]
+    lib.oidnCommitDevice.argtypes = [handle]
+    lib.oidnReleaseDevice.argtypes = [handle]
+    lib.oidnGetDeviceError.restype = ctypes.c_int
+    lib.oidnGetDeviceError.argtypes = [handle, ctypes.POINTER(ctypes.c_char_p)]
+    lib.oidnNewFilter.restype = handle
+    lib.oidnNewFilter.argtypes = [handle, ctypes.c_char_p]
+    lib.oidnSetSharedFilterImage.argtypes = [
+        handle,
+        ctypes.c_char_p,
+        ctypes.c_void_p,
+        ctypes.c_int,
+        ctypes.c_size_t,
+        ctypes.c_size_t,
+        ctypes.c_size_t,
+        ctypes.c_size_t,
+        ctypes.c_size_t,
+    ]
+    # OpenImageDenoise 2 renamed oidnSetFilter1b
+    set_bool = getattr(lib, "oidnSetFilterBool", None) or lib.oidnSetFilter1b
+    set_bool.argtypes = [handle, ctypes.c_char_p, ctypes.c_bool]
+    lib.set_filter_bool = set_bool
+    for name in ("oidnCommitFilter", "oidnExecuteFilter", "oidnReleaseFilter"):
+        getattr(lib, name).argtypes = [handle]
+    return lib
+
+
+def _check(lib, device):
+    message = ctypes.c_char_p()
+    if lib.oidnGetDeviceError(device, ctypes.byref(message)):
+        text = message.value.decode("utf-8", "replace") if message.value else ""
+        raise RuntimeError("OpenImageDenoise error: %s" % text)
+
+
+def _device():
+    global _LIBRARY, _DEVICE
+    if _DEVICE is None:
+        if _LIBRARY is None:
+            _LIBRARY = _load_library()
+        device = _LIBRARY.oidnNewDevice(_DEVICE_TYPE_DEFAULT)
+        if not device:
+            raise RuntimeError("Cannot create an OpenImageDenoise device")
+        _LIBRARY.oidnCommitDevice(device)
+        _check(_LIBRARY, device)
+        _DEVICE = device
+    return _LIBRARY, _DEVICE
+
+
+def _image(name, array, shape):
+    # Float32 array with C-contiguous rows, and at least 3 channels
+    if array is None:
+        return None
+    array = np.ascontiguousarray(array, dtype=np.float32)
+    if array.shape[:2] != shape or array.ndim != 3 or array.shape[2] < 3:
+        raise ValueError("'%s' must be a (%d, %d, 3+) array" % ((name,) + shape))
+    return array
+
+
+def _bind(lib, filt, name, array):
+    height, width, channels = array.shape
+    lib.oidnSetSharedFilterImage(
+        filt,
+        name,
+        array.ctypes.data,
+        _FORMAT_FLOAT3,
+        width,
+        height,
+        0,
+        channels * 4,
+        width * channels * 4,
+    )
+
+
+def denoise(color, albedo=None, normal=None, hdr=True, out=None):
+    """Denoise a (height, width, channels) float image, return the result.
+
+    Only the first 3 channels of each image are used. `albedo` and
+    `normal` are optional auxiliary images of the same size (a normal
+    requires an albedo); `hdr` tells whether colors are high dynamic
+    range. The result is written into `out` if given, a float32
+    (height, width, 3) array, otherwise into a new array.
+
+    The OpenImageDenoise device and filters are created on first use and
+    reused by later calls; see release_denoiser.
+    """
+    if normal is not None and albedo is None:
+        raise ValueError("A normal image requires an albedo image")
+    color = np.asarray(color)
+    if color.ndim != 3:
+        raise ValueError("'color' must be a (height, width, channels) array")
+    shape = color.shape[:2]
+    color = _image("color", color, shape)
+    albedo = _image("albedo", albedo, shape)
+    normal = _image("normal", normal, shape)
+    if out is None:
+        out = np.empty(shape + (3,), dtype=np.float32)
+    elif (
+        out.shape != shape + (3,)
+        or out.dtype != np.float32
+        or not out.flags.c_contiguous
+    ):
+        raise ValueError("'out' must be a contiguous float32 (H, W, 3) array")
+
+    with _LOCK:
+        lib, device = _device()
+        key = (albedo is not None, normal is not None, bool(hdr))
+        filt = _FILTERS.get(key)
+        if filt is None:
+            filt = lib.oidnNewFilter(device, b"RT")
+            _check(lib, device)
+            lib.set_filter_bool(filt, b"hdr", bool(hdr))
+            _FILTERS[key] = filt
+        _bind(lib, filt, b"color", color)
+        if albedo is not None:
+            _bind(lib, filt, b"albedo", albedo)
+        if normal is not None:
+            _bind(lib, filt, b"normal", normal)
+        _bind(lib, filt, b"output", out)
+        # Commit is cheap when only image pointers changed
+        lib.oidnCommitFilter(filt)
+        lib.oidnExecuteFilter(filt)
+        _check(lib, device)
+    return out
+
+
+def release_denoiser():
+    """Release the OpenImageDenoise filters and device."""
+    global _DEVICE
+    with _LOCK:
+        if _DEVICE is None:
+            return
+        for filt in _FILTERS.values():
+            _LIBRARY.oidnReleaseFilter(filt)
+        _FILTERS.clear()
+        _LIBRARY.oidnReleaseDevice(_DEVICE)
+        _DEVICE = None
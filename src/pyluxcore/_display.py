@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Conversion of float film outputs to display buffers."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+import numpy as np
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+# Minimal number of pixels for a chunk to be worth a thread
+_MIN_CHUNK_PIXELS = 1 << 16
+
+
+def _executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                thread_name_prefix="pyluxcore-convert",
+            )
+        return _EXECUTOR
+
+
+def _srgb(x):
+    # sRGB transfer function, in place
+    low = x <= 0.0031308
+    lowvalues = x[low] * 12.92
+    np.power(x, 1.0 / 2.4, out=x)
+    x *= 1.055
+    x -= 0.055
+    x[low] = lowvalues
+
+
+def _convert_rows(src, out, rows, exposure, gamma, srgb, dither, seed):
+    begin, end = rows
+    channels = min(src.shape[2], 3)
+    work = np.array(src[begin:end, :, :channels], dtype=np.float32)
+    if exposure != 1.0:
+        work *= exposure
+    np.maximum(work, 0.0, out=work)
+    if srgb:
+        _srgb(work)
+    elif gamma is not None and gamma != 1.0:
+        np.power(work, 1.0 / gamma, out=work)
+
+    dst = out[begin:end]
+    if out.dtype.kind == "f":
+        dst[..., :channels] = work
+        if out.shape[2] > channels:
+            if src.shape[2] > channels:
+                dst[..., channels] = src[begin:end, :, channels]
+            else:
+                dst[..., channels] = 1.0
+        return
+
+    maxval = np.iinfo(out.dtype).max
+    rng = np.random.default_rng(seed) if dither else None
+    np.minimum(work, 1.0, out=work)
+    work *= maxval
+    if rng is not None:
+        work += rng.random(work.shape, dtype=np.float32)
+        work -= 0.5
+    np.rint(work, out=work)
+    np.clip(work, 0, maxval, out=work)
+    dst[..., :channels] = work
+    if out.shape[2] > channels:
+        if src.shape[2] > channels:
+            alpha = np.clip(src[begin:end, :, channels], 0.0, 1.0) * maxval
+            dst[..., channels] = np.rint(alpha)
+        else:
+            dst[..., channels] = maxval
+
+
+def convert_to_display(src, out=None, exposure=1.0, gamma=None, srgb=False,
+                       dither=False, flip=False, dtype=np.uint8, threads=None):
+    """Convert a float (height, width, channels) image to a display buffer.
+
+    Color channels are scaled by `exposure`, then encoded with the sRGB
+    transfer function if `srgb` is set, or with a 1/`gamma` power if
+    `gamma` is given; an alpha (4th) channel is passed through.
+    Integer outputs (uint8, uint16) are clamped to [0, 1] before
+    quantization, with optional uniform dithering; half float outputs are
+    not clamped above. `flip` reverses row order (film outputs are stored
+    bottom-up).
+
+    The result is written into `out` if given, which must have the same
+    height and width as `src`, and 3 or 4 channels (alpha is set opaque
+    if `src` has none). Otherwise an array of `dtype` with the channel
+    count of `src` is allocated. Rows are processed in parallel chunks on
+    up to `threads` threads (default: all cores).
+
+    Return `out`.
+    """
+    if src.ndim != 3 or src.shape[2] not in (1, 2, 3, 4):
+        raise ValueError("Source must be a (height, width, channels) array")
+    height, width = src.shape[:2]
+    if out is None:
+        out = np.empty(src.shape, dtype=dtype)
+    channels = min(src.shape[2], 3)
+    if out.shape[:2] != (height, width) or out.shape[2] not in (
+        channels,
+        4 if channels == 3 else channels,
+    ):
+        raise ValueError(
+            "Output shape %s does not match source shape %s"
+            % (out.shape, src.shape)
+        )
+    if out.dtype not in (np.uint8, np.uint16, np.float16, np.float32):
+        raise ValueError("Unsupported output type: %s" % out.dtype)
+    if flip:
+        src = src[::-1]
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+    chunks = max(1, min(threads, height * width // _MIN_CHUNK_PIXELS, height))
+    bounds = np.linspace(0, height, chunks + 1).astype(int)
+    seeds = np.random.SeedSequence().spawn(chunks) if dither else [None] * chunks
+    args = (exposure, gamma, srgb, dither)
+    if chunks == 1:
+        _convert_rows(src, out, (0, height), *args, seeds[0])
+        return out
+    futures = [
+        _executor().submit(
+            _convert_rows, src, out, (bounds[i], bounds[i + 1]), *args, seeds[i]
+        )
+        for i in range(chunks)
+    ]
+    for future in futures:
+        future.result()
+    return out
@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Batched scene edits of a running render session."""
+
+from collections import namedtuple
+import time
+
+import numpy as np
+
+from ._scene import to_luxcore_matrix
+
+EditReport = namedtuple("EditReport", ["changes", "begin", "apply", "end", "total"])
+EditReport.__doc__ = """Timings of a batched scene edit, in seconds.
+
+changes: count of applied edits per kind ("transform", "material",
+"delete", "props"); begin: BeginSceneEdit (render threads stop); apply:
+edits applied to the scene; end: EndSceneEdit (scene preprocessing and
+render restart); total: whole edit.
+"""
+
+
+class SceneEdit:
+    """Batch scene edits of a running session, applied in one go.
+
+    Edits are recorded, and applied in the same order by apply() (or
+    when leaving the `with` block without error), between one
+    BeginSceneEdit and one EndSceneEdit call. Transformations and
+    materials go through the dedicated object updates, so that LuxCore
+    only updates the affected instances instead of reparsing objects.
+
+    Edits of each object are coalesced between two parse() calls, as
+    parsed properties may redefine objects: only the last material and
+    the last transformation of an instanced object are applied (matrices
+    of non-instanced objects are composed, see transform), and edits of
+    an object deleted afterwards are dropped. Editing an object deleted in the
+    batch raises ValueError, unless properties were parsed since.
+
+    The EditReport of the last application is available as `report`.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.report = None
+        self._clear()
+
+    def _clear(self):
+        self._edits = []  # [kind, name, value] in record order, None if dropped
+        self._latest = {}  # (kind, name) -> index in _edits, since last parse
+
+    def _record(self, kind, name, value, merge=None):
+        # Record an edit, or merge it into the pending one of the object
+        if ("delete", name) in self._latest:
+            raise ValueError("Object '%s' is deleted in this edit" % name)
+        i = self._latest.get((kind, name))
+        if i is None:
+            self._latest[(kind, name)] = len(self._edits)
+            self._edits.append([kind, name, value])
+        elif merge is None:
+            self._edits[i][2] = value
+        else:
+            self._edits[i][2] = merge(self._edits[i][2], value)
+
+    def transform(self, name, matrix, instanced=True):
+        """Transform an object with a 4x4 matrix (see to_luxcore_matrix).
+
+        For an instanced object (the default), the matrix replaces the
+        instance transformation, which is cheap: only the last matrix of
+        the object is applied. For a plain, non-instanced mesh, LuxCore
+        applies the matrix to the vertices, on top of any earlier one,
+        and rebuilds the geometry; pass instanced=False, and the matrices
+        of the object are composed.
+        """
+        matrix = np.asarray(matrix, dtype=np.float64).reshape(4, 4)
+
+        def merge(pending, value):
+            if pending[0] != value[0]:
+                raise ValueError("Object '%s' is both instanced and not" % name)
+            if instanced:
+                return value
+            return instanced, value[1] @ pending[1]
+
+        self._record("transform", name, (instanced, matrix), merge)
+
+    def material(self, name, material):
+        """Set the material of an object."""
+        self._record("material", name, material)
+
+    def delete(self, name):
+        """Delete an object."""
+        if ("delete", name) in self._latest:
+            return
+        for kind in ("transform", "material"):
+            i = self._latest.pop((kind, name), None)
+            if i is not None:
+                self._edits[i] = None
+        self._latest[("delete", name)] = len(self._edits)
+        self._edits.append(["delete", name, None])
+
+    def parse(self, props):
+        """Parse scene properties (new objects, lights, textures...)."""
+        self._latest.clear()
+        self._edits.append(["props", None, props])
+
+    def changes(self):
+        """Return the count of pending edits per kind."""
+        changes = dict.fromkeys(("transform", "material", "delete", "props"), 0)
+        for edit in self._edits:
+            if edit is not None:
+                changes[edit[0]] += 1
+        return changes
+
+    def apply(self):
+        """Apply pending edits, return the EditReport."""
+        changes = self.changes()
+        if not any(changes.values()):
+            self.report = EditReport(changes, 0.0, 0.0, 0.0, 0.0)
+            return self.report
+        start = time.perf_counter()
+        self.session.BeginSceneEdit()
+        begin = time.perf_counter()
+        try:
+            scene = self.session.GetRenderConfig().GetScene()
+            for edit in self._edits:
+                if edit is None:
+                    continue
+                kind, name, value = edit
+                if kind == "props":
+                    scene.Parse(value)
+                elif kind == "transform":
+                    matrix = to_luxcore_matrix(value[1])
+                    scene.UpdateObjectTransformation(name, matrix)
+                elif kind == "material":
+                    scene.UpdateObjectMaterial(name, value)
+                else:
+                    scene.DeleteObject(name)
+        finally:
+            self._clear()
+            applied = time.perf_counter()
+            self.session.EndSceneEdit()
+        end = time.perf_counter()
+        self.report = EditReport(
+            changes, begin - start, applied - begin, end - applied, end - start
+        )
+        return self.report
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.apply()
+        else:
+            self._clear()
@@ -0,0 +1,165 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""NumPy access to film outputs."""
+
+import numpy as np
+
+from .pyluxcore import FilmOutputType
+
+# Outputs stored as unsigned integers by the film; all others are float
+_UINT_OUTPUTS = frozenset(
+    (
+        FilmOutputType.MATERIAL_ID,
+        FilmOutputType.OBJECT_ID,
+        FilmOutputType.SAMPLECOUNT,
+    )
+)
+
+
+def output_dtype(output_type):
+    """Return the numpy dtype of a film output type."""
+    if output_type in _UINT_OUTPUTS:
+        return np.dtype(np.uint32)
+    return np.dtype(np.float32)
+
+
+class FilmOutputs:
+    """Pool of reusable numpy buffers for the outputs of a film.
+
+    Buffers are allocated on first request and reused afterwards, as long
+    as the film size does not change. Arrays are returned as read-only
+    views of shape (height, width, channels); rows are stored bottom-up,
+    as in the film. A view is overwritten by the next request for the
+    same output: copy it if it must be kept.
+    """
+
+    def __init__(self, film):
+        self._film = film
+        self._pool = {}
+
+    @property
+    def film(self):
+        """The film outputs are read from."""
+        return self._film
+
+    def shape(self, output_type):
+        """Return the (height, width, channels) shape of an output."""
+        film = self._film
+        width, height = film.GetWidth(), film.GetHeight()
+        channels = film.GetOutputSize(output_type) // (width * height)
+        return height, width, channels
+
+    def buffer(self, output_type, index=0):
+        """Return the writable pooled buffer for an output.
+
+        The buffer is not refreshed from the film.
+        """
+        shape = self.shape(output_type)
+        key = (output_type, index)
+        buffer = self._pool.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=output_dtype(output_type))
+            self._pool[key] = buffer
+        return buffer
+
+    def get(self, output_type, index=0, execute_imagepipeline=True):
+        """Refresh an output from the film and return a read-only view."""
+        buffer = self.buffer(output_type, index)
+        if buffer.dtype == np.uint32:
+            self._film.GetOutputUInt(output_type, buffer, index)
+        else:
+            self._film.GetOutputFloat(
+                output_type, buffer, index, execute_imagepipeline
+            )
+        view = buffer.view()
+        view.flags.writeable = False
+        return view
+
+    def get_region(self, output_type, x, y, width, height, index=0,
+                   execute_imagepipeline=True):
+        """Refresh an output and return a read-only view of a region.
+
+        The region spans columns x to x + width and rows y to y + height,
+        rows being counted bottom-up, as stored in the film. The whole
+        output is read back: the region is a view on the pooled buffer.
+        """
+        view = self.get(output_type, index, execute_imagepipeline)
+        rows, columns = view.shape[:2]
+        if not (0 <= x and 0 <= y and x + width <= columns and y + height <= rows):
+            raise ValueError("Region out of the film")
+        return view[y : y + height, x : x + width]
+
+    def release(self):
+        """Drop all pooled buffers."""
+        self._pool.clear()
+
+
+class DirtyTiles:
+    """Track the tiles of an image that changed between two updates.
+
+    The image is split into square tiles of `tile_size` pixels (smaller
+    at the right and top borders). update() compares a new image with the
+    previous one, all tiles at once, and returns the changed tiles, so
+    that only those need to be processed or sent. Pixels are considered
+    changed if any channel differs by more than `tolerance` from the last
+    reported state of their tile.
+    """
+
+    def __init__(self, tile_size=32, tolerance=0.0):
+        if tile_size < 1:
+            raise ValueError("Expected a positive tile size")
+        self.tile_size = tile_size
+        self.tolerance = tolerance
+        self._previous = None
+
+    def reset(self):
+        """Forget the previous image: the next update marks all tiles."""
+        self._previous = None
+
+    def update(self, image):
+        """Return the (x, y, width, height) tiles changed in `image`.
+
+        `image` is a (height, width[, channels]) array; a copy is kept
+        for the next comparison. The first update returns all tiles.
+        """
+        image = np.asarray(image)
+        height, width = image.shape[:2]
+        size = self.tile_size
+        rows = np.arange(0, height, size)
+        columns = np.arange(0, width, size)
+        previous = self._previous
+        if previous is None or previous.shape != image.shape:
+            self._previous = image.copy()
+            dirty = np.ones((len(rows), len(columns)), dtype=bool)
+        elif image.size:
+            if self.tolerance:
+                changed = (
+                    np.abs(np.subtract(image, previous, dtype=np.float64))
+                    > self.tolerance
+                )
+            else:
+                changed = image != previous
+            if changed.ndim > 2:
+                changed = changed.reshape(height, width, -1).any(axis=2)
+            dirty = np.logical_or.reduceat(
+                np.logical_or.reduceat(changed, rows, axis=0), columns, axis=1
+            )
+            if self.tolerance:
+                # Keep the reference of clean tiles, so that slow drifts
+                # are eventually reported
+                mask = np.repeat(np.repeat(dirty, size, axis=0), size, axis=1)
+                mask = mask[:height, :width].reshape(
+                    (height, width) + (1,) * (image.ndim - 2)
+                )
+                np.copyto(previous, image, where=mask)
+            else:
+                np.copyto(previous, image)
+        else:
+            return []
+        ys, xs = dirty.nonzero()
+        return [
+            (x, y, min(size, width - x), min(size, height - y))
+            for y, x in zip(rows[ys].tolist(), columns[xs].tolist())
+        ]
@@ -0,0 +1,176 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Image writers for numpy buffers (PPM, PFM, PNG, EXR)."""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+# PNG color types, per channel count
+_PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+
+def _executor():
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, min(4, os.cpu_count() or 1)),
+                thread_name_prefix="pyluxcore-writer",
+            )
+        return _EXECUTOR
+
+
+def _as_image(pixels):
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+    if pixels.ndim != 3 or pixels.shape[2] not in (1, 2, 3, 4):
+        raise ValueError("Image must be a (height, width, channels) array")
+    return pixels
+
+
+def _check_integer(pixels, fmt):
+    if pixels.dtype not in (np.uint8, np.uint16):
+        raise ValueError(
+            "%s images must be uint8 or uint16, not %s "
+            "(see convert_to_display)" % (fmt, pixels.dtype)
+        )
+
+
+# PNM extensions bound to gray or color content
+_PNM_CHANNELS = {".pgm": (1, 2), ".ppm": (3, 4)}
+
+
+def _write_ppm(path, pixels):
+    _check_integer(pixels, "PPM")
+    height, width, channels = pixels.shape
+    allowed = _PNM_CHANNELS.get(Path(path).suffix.lower())
+    if allowed is not None and channels not in allowed:
+        raise ValueError(
+            "'%s' images must have %s channels, not %d (use .pnm for either)"
+            % (Path(path).suffix.lower(), " or ".join(map(str, allowed)), channels)
+        )
+    if channels in (1, 2):
+        magic, pixels = b"P5", pixels[:, :, :1]
+    else:
+        magic, pixels = b"P6", pixels[:, :, :3]
+    maxval = np.iinfo(pixels.dtype).max
+    data = np.ascontiguousarray(pixels, dtype=pixels.dtype.newbyteorder(">"))
+    with open(path, "wb") as f:
+        f.write(b"%s\n%d %d\n%d\n" % (magic, width, height, maxval))
+        f.write(data.tobytes())
+
+
+def _write_pfm(path, pixels):
+    height, width, channels = pixels.shape
+    if channels in (1, 2):
+        magic, pixels = b"Pf", pixels[:, :, :1]
+    else:
+        magic, pixels = b"PF", pixels[:, :, :3]
+    # PFM scanlines are stored bottom-up; negative scale is little endian
+    data = np.ascontiguousarray(pixels[::-1], dtype="<f4")
+    with open(path, "wb") as f:
+        f.write(b"%s\n%d %d\n-1.0\n" % (magic, width, height))
+        f.write(data.tobytes())
+
+
+def _png_chunk(tag, data):
+    chunk = struct.pack(">I", len(data)) + tag + data
+    return chunk + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def _write_png(path, pixels, compression):
+    _check_integer(pixels, "PNG")
+    height, width, channels = pixels.shape
+    depth = pixels.dtype.itemsize * 8
+    data = np.ascontiguousarray(pixels, dtype=pixels.dtype.newbyteorder(">"))
+    # Each scanline starts with its filter type (0: none)
+    raw = np.zeros((height, 1 + width * channels * data.itemsize), np.uint8)
+    raw[:, 1:] = data.view(np.uint8).reshape(height, -1)
+    header = struct.pack(
+        ">IIBBBBB", width, height, depth, _PNG_COLOR_TYPES[channels], 0, 0, 0
+    )
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", header))
+        f.write(_png_chunk(b"IDAT", zlib.compress(raw.tobytes(), compression)))
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def _write_exr(path, pixels, exr_compression):
+    try:
+        import OpenImageIO as oiio
+    except ImportError as err:
+        raise RuntimeError(
+            "Writing EXR images requires OpenImageIO Python bindings"
+        ) from err
+    if pixels.dtype == np.float16:
+        pixeltype = oiio.HALF
+    else:
+        pixeltype, pixels = oiio.FLOAT, pixels.astype(np.float32, copy=False)
+    height, width, channels = pixels.shape
+    spec = oiio.ImageSpec(width, height, channels, pixeltype)
+    spec.attribute("compression", exr_compression)
+    output = oiio.ImageOutput.create(str(path))
+    if output is None or not output.open(str(path), spec):
+        raise RuntimeError("Cannot open '%s': %s" % (path, oiio.geterror()))
+    try:
+        if not output.write_image(np.ascontiguousarray(pixels)):
+            raise RuntimeError("Cannot write '%s': %s" % (path, output.geterror()))
+    finally:
+        output.close()
+
+
+def _write(path, pixels, compression, exr_compression):
+    suffix = Path(path).suffix.lower()
+    if suffix in (".ppm", ".pgm", ".pnm"):
+        _write_ppm(path, pixels)
+    elif suffix == ".pfm":
+        _write_pfm(path, pixels)
+    elif suffix == ".png":
+        _write_png(path, pixels, compression)
+    elif suffix == ".exr":
+        _write_exr(path, pixels, exr_compression)
+    else:
+        raise ValueError("Unsupported image format: '%s'" % suffix)
+    return path
+
+
+def save_image(path, pixels, compression=6, exr_compression="zip",
+               background=False):
+    """Write a (height, width, channels) numpy image to `path`.
+
+    The format is chosen from the file extension:
+    - .pgm/.ppm/.pnm: binary PNM, uint8 or uint16 pixels; .pgm takes
+      gray images (1 or 2 channels), .ppm color ones (3 or 4 channels),
+      .pnm either;
+    - .pfm: float pixels;
+    - .png: uint8 or uint16 pixels, zlib `compression` level from 0
+      (fastest) to 9 (smallest);
+    - .exr: half or float pixels, `exr_compression` codec ("none", "zip",
+      "piz", "dwaa"...); requires OpenImageIO Python bindings.
+
+    Rows are written top-down: flip film outputs (e.g. pixels[::-1])
+    beforehand if needed. Alpha is dropped for PNM/PFM formats.
+
+    If `background` is set, the image is copied and written in a
+    background thread, and a concurrent.futures.Future is returned;
+    otherwise the write is synchronous and `path` is returned.
+    """
+    pixels = _as_image(pixels)
+    if background:
+        return _executor().submit(
+            _write, path, np.array(pixels), compression, exr_compression
+        )
+    return _write(path, pixels, compression, exr_compression)
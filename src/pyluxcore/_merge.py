@@ -0,0 +1,203 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Merging of films rendered separately."""
+
+import os
+
+import numpy as np
+
+from .pyluxcore import Film, FilmOutputType
+from ._film import output_dtype
+
+
+def merge_films(paths, output=None):
+    """Merge films saved in .flm files, return the merged Film.
+
+    Films must have the same size and outputs. Their sample sums and
+    weights are added (see Film.AddFilm), so each film contributes in
+    proportion to its sample count. If `output` is given, the merged film
+    is also saved there.
+    """
+    paths = [os.fspath(path) for path in paths]
+    if not paths:
+        raise ValueError("No film to merge")
+    film = Film(paths[0])
+    for path in paths[1:]:
+        film.AddFilm(Film(path))
+    if output is not None:
+        film.SaveFilm(os.fspath(output))
+    return film
+
+
+# Outputs not averaged: derived from others, or identifiers
+_SKIPPED_OUTPUTS = frozenset((FilmOutputType.RGB_IMAGEPIPELINE,))
+_FIRST_OUTPUTS = frozenset((FilmOutputType.MATERIAL_ID, FilmOutputType.OBJECT_ID))
+
+
+def _film_outputs(film):
+    # (type, index) of the outputs of a film
+    keys = []
+    for output_type in sorted(FilmOutputType.values.values(), key=int):
+        if output_type in _SKIPPED_OUTPUTS or not film.HasOutput(output_type):
+            continue
+        # Mask and per ID outputs (MATERIAL_ID_MASK, BY_OBJECT_ID...) may
+        # be defined several times, like radiance groups
+        if output_type == FilmOutputType.RADIANCE_GROUP:
+            count = film.GetRadianceGroupCount()
+        else:
+            count = film.GetOutputCount(output_type)
+        keys.extend((output_type, index) for index in range(count))
+    return keys
+
+
+def _merge_mode(output_type):
+    if output_type in _FIRST_OUTPUTS:
+        return "first"
+    if output_type == FilmOutputType.SAMPLECOUNT:
+        return "sum"
+    return "weighted"
+
+
+class _Accumulator:
+    # A .npy file updated by chunks of rows, each mapped only while used
+    def __init__(self, path, shape, dtype, mode):
+        np.lib.format.open_memmap(path, "w+", dtype, shape).flush()
+        array = np.load(path, mmap_mode="r")
+        self.offset = array.offset
+        del array
+        self.path = path
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.mode = mode
+        self.row_bytes = int(np.prod(shape[1:])) * self.dtype.itemsize
+
+    def rows(self, start, stop):
+        return np.memmap(
+            self.path,
+            self.dtype,
+            "r+",
+            self.offset + start * self.row_bytes,
+            (stop - start,) + self.shape[1:],
+        )
+
+    def update(self, source, weights, chunk):
+        # Accumulate a full output into the file, chunk by chunk
+        for start in range(0, self.shape[0], chunk):
+            stop = min(start + chunk, self.shape[0])
+            rows = self.rows(start, stop)
+            if self.mode == "weighted":
+                rows += source[start:stop] * weights[start:stop]
+            elif self.mode == "first":
+                rows[...] = source[start:stop]
+            else:
+                rows += source[start:stop]
+            rows.flush()
+            del rows
+
+    def normalize(self, weights, chunk):
+        # Weighted sums to weighted means
+        for start in range(0, self.shape[0], chunk):
+            stop = min(start + chunk, self.shape[0])
+            rows = self.rows(start, stop)
+            total = weights.rows(start, stop)
+            np.divide(rows, total, out=rows, where=total > 0.0)
+            rows.flush()
+            del rows, total
+
+
+def _create_accumulators(film, keys, folder):
+    height, width = film.GetHeight(), film.GetWidth()
+    accumulators = {
+        "weights": _Accumulator(
+            os.path.join(folder, "weights.npy"), (height, width, 1), np.float64, "sum"
+        )
+    }
+    for key in keys:
+        output_type, index = key
+        mode = _merge_mode(output_type)
+        accumulators[key] = _Accumulator(
+            os.path.join(folder, "%s_%d.npy" % (output_type.name, index)),
+            (height, width, film.GetOutputSize(output_type) // (width * height)),
+            np.float64 if mode == "weighted" else output_dtype(output_type),
+            mode,
+        )
+    return accumulators
+
+
+def stream_merge_films(paths, folder, max_memory=1 << 28):
+    """Merge the outputs of .flm films into memory-mapped arrays.
+
+    Films are loaded one at a time, and their outputs, read one at a
+    time, are accumulated into .npy files in `folder`, by chunks of rows
+    of at most about `max_memory` bytes: memory use depends on the size
+    of one film, not on the film count. Each film is weighted per pixel
+    by its SAMPLECOUNT output if it has one, by its total sample count
+    otherwise. Material and object IDs are taken from the first film,
+    sample counts are added, and RGB_IMAGEPIPELINE is skipped, as it is
+    derived from the others. Outputs defined several times (radiance
+    groups, ID masks, per ID outputs) are merged index by index.
+
+    Return a dict {(output type, index): array} of arrays memory-mapped
+    on the .npy files, which are kept in `folder`. Merged weights are
+    under the "weights" key.
+    """
+    paths = [os.fspath(path) for path in paths]
+    if not paths:
+        raise ValueError("No film to merge")
+    os.makedirs(folder, exist_ok=True)
+    accumulators = first_keys = chunk = None
+    buffers = {}  # Readback buffers, by (shape, dtype)
+
+    for path in paths:
+        film = Film(path)
+        keys = _film_outputs(film)
+        if accumulators is None:
+            first_keys = keys
+            accumulators = _create_accumulators(film, keys, folder)
+            # Each chunk is mapped along with the matching source rows
+            row_bytes = max(a.row_bytes for a in accumulators.values()) * 2
+            chunk = max(1, max_memory // row_bytes)
+        elif keys != first_keys or (film.GetHeight(), film.GetWidth()) != (
+            accumulators["weights"].shape[:2]
+        ):
+            raise ValueError("Film %s does not match the first film" % path)
+
+        def read(film, key):
+            output_type, index = key
+            shape = accumulators[key].shape
+            dtype = output_dtype(output_type)
+            buffer = buffers.get((shape, dtype))
+            if buffer is None:
+                buffer = buffers[shape, dtype] = np.empty(shape, dtype=dtype)
+            if dtype == np.uint32:
+                film.GetOutputUInt(output_type, buffer, index)
+            else:
+                film.GetOutputFloat(output_type, buffer, index, False)
+            return buffer
+
+        if (FilmOutputType.SAMPLECOUNT, 0) in accumulators:
+            weights = read(film, (FilmOutputType.SAMPLECOUNT, 0)).astype(np.float32)
+        else:
+            total = film.GetStats().Get("stats.film.total.samplecount").GetFloat()
+            weights = np.broadcast_to(
+                np.float32(total), accumulators["weights"].shape
+            )
+
+        accumulators["weights"].update(weights, None, chunk)
+        for key in keys:
+            accumulator = accumulators[key]
+            if accumulator.mode == "first" and path != paths[0]:
+                continue
+            accumulator.update(read(film, key), weights, chunk)
+        del film, weights
+
+    for key in first_keys:
+        accumulator = accumulators[key]
+        if accumulator.mode == "weighted":
+            accumulator.normalize(accumulators["weights"], chunk)
+    return {
+        key: np.load(accumulator.path, mmap_mode="r+")
+        for key, accumulator in accumulators.items()
+    }
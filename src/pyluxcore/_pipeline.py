@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Image pipeline evaluation with cached intermediate results."""
+
+import numpy as np
+
+from .pyluxcore import FilmOutputType, Properties, Property
+from ._film import FilmOutputs
+from ._progress import _fetch_stats
+
+# Stages whose results are worth reusing across passes
+_DENOISERS = frozenset(("INTEL_OIDN", "OPTIX_DENOISER"))
+
+
+def _tonemap_linear(image, stage):
+    image *= np.float32(stage.get("scale", 1.0))
+
+
+def _gamma_correction(image, stage):
+    # Clamped to [0, 1] first, as LuxCore does before its table lookup
+    np.clip(image, 0.0, 1.0, out=image)
+    np.power(image, np.float32(1.0 / stage.get("value", 2.2)), out=image)
+
+
+# Stages evaluated with numpy, in place on a float32 RGB image
+_NUMPY_STAGES = {
+    "TONEMAP_LINEAR": _tonemap_linear,
+    "GAMMA_CORRECTION": _gamma_correction,
+}
+
+# Native pipeline leaving the film image unchanged
+_NEUTRAL = ({"type": "TONEMAP_LINEAR", "scale": 1.0},)
+
+
+def _stage_key(stage):
+    return tuple(
+        sorted(
+            (name, tuple(value) if isinstance(value, (list, tuple)) else value)
+            for name, value in stage.items()
+        )
+    )
+
+
+def _split(stages):
+    # Native prefix and numpy suffix: the trailing numpy capable stages
+    split = len(stages)
+    while split > 0 and stages[split - 1]["type"] in _NUMPY_STAGES:
+        split -= 1
+    return stages[:split], stages[split:]
+
+
+def pipeline_properties(pipelines, first=0):
+    """Return film Properties defining image pipelines.
+
+    `pipelines` is a list of pipelines, each a list of stage dicts (see
+    PipelineCache); they get indices from `first` on.
+    """
+    props = Properties()
+    for index, stages in enumerate(pipelines, first):
+        root = "film.imagepipelines.%d." % index
+        for i, stage in enumerate(stages):
+            for name, value in stage.items():
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                props.Set(Property(root + "%d.%s" % (i, name), list(value)))
+    return props
+
+
+def parse_pipeline(text):
+    """Parse a pipeline from text, return a list of stage dicts.
+
+    Stages are separated by ";", each one is a type followed by
+    name=value parameters, multiple values being separated by commas,
+    e.g. "TONEMAP_LINEAR scale=0.5; GAMMA_CORRECTION value=2.2".
+    """
+    stages = []
+    for chunk in text.split(";"):
+        words = chunk.split()
+        if not words:
+            continue
+        stage = {"type": words[0]}
+        for word in words[1:]:
+            name, sep, value = word.partition("=")
+            if not sep:
+                raise ValueError("Expected name=value, got '%s'" % word)
+            values = [_parse_value(v) for v in value.split(",")]
+            stage[name] = values[0] if len(values) == 1 else values
+        stages.append(stage)
+    return stages
+
+
+def _parse_value(value):
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+class PipelineCache:
+    """Evaluate an image pipeline of a session, reusing stage results.
+
+    The pipeline is given as a list of stages, each a dict with a "type"
+    key and the stage parameters, e.g. [{"type": "INTEL_OIDN"},
+    {"type": "TONEMAP_LINEAR", "scale": 0.5}, {"type":
+    "GAMMA_CORRECTION", "value": 2.2}]. It is split in two parts:
+
+    - a prefix, run by LuxCore as image pipeline `index` of the film.
+      Its result is cached, keyed by the prefix parameters and the pass
+      count, and is only refreshed when either changes; if the prefix
+      contains a denoiser, it is refreshed only every `denoise_interval`
+      passes, or when the pass count drops (the session restarted);
+    - a suffix of trailing TONEMAP_LINEAR and GAMMA_CORRECTION stages,
+      run with numpy on the cached prefix result. Changing their
+      parameters does not re-run the prefix.
+
+    The cache takes over the image pipelines of the film: setting a
+    pipeline redefines them, with the prefix at `index`.
+    """
+
+    def __init__(self, session, denoise_interval=64, index=0):
+        self.session = session
+        self.denoise_interval = denoise_interval
+        self.index = index
+        self.hits = 0
+        self.misses = 0
+        self._outputs = FilmOutputs(session.GetFilm())
+        self._prefix = None
+        self._suffix = ()
+        self._prefix_passes = None  # Pass count of the cached prefix result
+        self._generation = 0  # Incremented at each prefix refresh
+        self._result = None
+        self._result_key = None
+
+    def set_pipeline(self, stages):
+        """Set the pipeline, as a list of stage dicts."""
+        stages = [dict(stage) for stage in stages]
+        prefix, suffix = _split(stages)
+        prefix_key = tuple(_stage_key(stage) for stage in prefix)
+        if self._prefix is None or prefix_key != self._prefix[0]:
+            self._define(prefix or _NEUTRAL)
+            self._prefix = (prefix_key, prefix)
+            self._prefix_passes = None
+        self._suffix = suffix
+
+    def _define(self, stages):
+        self.session.Parse(pipeline_properties([stages], self.index))
+
+    def _denoised(self):
+        return any(stage["type"] in _DENOISERS for stage in self._prefix[1])
+
+    def get(self):
+        """Return the pipeline result, as a read-only (H, W, 3) array.
+
+        Rows are bottom-up, as in the film. The array is overwritten by
+        the next call.
+        """
+        if self._prefix is None:
+            raise RuntimeError("No pipeline set")
+        passes = _fetch_stats(self.session).Get("stats.renderengine.pass").GetInt()
+        cached = self._prefix_passes
+        # A lower pass count means the session restarted (scene edit)
+        if cached is None or passes < cached or (
+            passes - cached >= self.denoise_interval
+            if self._denoised()
+            else passes != cached
+        ):
+            image = self._outputs.get(
+                FilmOutputType.RGB_IMAGEPIPELINE, self.index, True
+            )
+            self._prefix_passes = passes
+            self._generation += 1
+            self.misses += 1
+        else:
+            image = self._outputs.buffer(FilmOutputType.RGB_IMAGEPIPELINE, self.index)
+            self.hits += 1
+
+        key = (self._generation, tuple(_stage_key(s) for s in self._suffix))
+        if self._result is None or self._result.shape != image.shape:
+            self._result = np.empty(image.shape, dtype=np.float32)
+            self._result_key = None
+        if key != self._result_key:
+            np.copyto(self._result, image)
+            for stage in self._suffix:
+                _NUMPY_STAGES[stage["type"]](self._result, stage)
+            self._result_key = key
+        view = self._result.view()
+        view.flags.writeable = False
+        return view
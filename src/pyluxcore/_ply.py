@@ -0,0 +1,247 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""PLY mesh reader.
+
+Binary files are memory-mapped, and mesh arrays are returned as views on
+the mapping wherever the file layout allows it: the file content is not
+copied, and its pages are shared with the operating system cache. Such
+views follow the file, so they are meant for one-shot reads; arrays kept
+beyond that, e.g. in a cache, must be read with mmap=False.
+
+This only bounds the memory of the read itself: define_mesh still hands
+the arrays to LuxCore as Python tuple lists, which take several times
+the size of the file while the mesh is being defined.
+"""
+
+import numpy as np
+
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+
+_BYTE_ORDERS = {
+    "ascii": "=",
+    "binary_little_endian": "<",
+    "binary_big_endian": ">",
+}
+
+
+class _Element:
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []  # (name, type) or (name, (count type, item type))
+
+    def dtype(self, order):
+        # Record dtype, for elements without list properties
+        return np.dtype([(n, order + _PLY_TYPES[t]) for n, t in self.properties])
+
+    def has_lists(self):
+        return any(isinstance(t, tuple) for _, t in self.properties)
+
+
+def _read_header(f):
+    if f.readline().strip() != b"ply":
+        raise ValueError("Not a PLY file")
+    fmt, elements = None, []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("Truncated PLY header")
+        words = line.decode("ascii").split()
+        if not words or words[0] in ("comment", "obj_info"):
+            continue
+        if words[0] == "format":
+            fmt = words[1]
+        elif words[0] == "element":
+            elements.append(_Element(words[1], int(words[2])))
+        elif words[0] == "property":
+            if words[1] == "list":
+                elements[-1].properties.append((words[4], (words[2], words[3])))
+            else:
+                elements[-1].properties.append((words[2], words[1]))
+        elif words[0] == "end_header":
+            break
+    if fmt not in _BYTE_ORDERS:
+        raise ValueError("Unsupported PLY format: %s" % fmt)
+    return fmt, elements, f.tell()
+
+
+def _triangulate(counts, indices):
+    # Fan triangulation of polygons given as flat indices and counts
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.size and (counts == 3).all():
+        return indices.reshape(-1, 3)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    triangles = counts - 2
+    first = np.repeat(starts, triangles)
+    offsets = np.arange(triangles.sum()) - np.repeat(
+        np.cumsum(triangles) - triangles, triangles
+    )
+    fan = np.stack((first, first + offsets + 1, first + offsets + 2), axis=1)
+    return indices[fan]
+
+
+def _binary_faces(buffer, offset, element, order):
+    # Faces with a single list property; fast path for constant sizes
+    _, (count_type, index_type) = element.properties[0]
+    count_dtype = np.dtype(order + _PLY_TYPES[count_type])
+    index_dtype = np.dtype(order + _PLY_TYPES[index_type])
+    if element.count == 0:
+        return np.empty((0, 3), np.uint32), offset
+    size = int(np.frombuffer(buffer, count_dtype, 1, offset)[0])
+    record = np.dtype([("n", count_dtype), ("i", index_dtype, (size,))])
+    end = offset + record.itemsize * element.count
+    if end <= len(buffer):
+        records = np.frombuffer(buffer, record, element.count, offset)
+        if (records["n"] == size).all():
+            if size == 3:
+                # Triangles: a strided view on the file, no copy
+                return records["i"], end
+            return _triangulate(np.full(element.count, size), records["i"].ravel()), end
+    # Variable polygon sizes: walk the records
+    counts, chunks = [], []
+    for _ in range(element.count):
+        n = int(np.frombuffer(buffer, count_dtype, 1, offset)[0])
+        offset += count_dtype.itemsize
+        chunks.append(np.frombuffer(buffer, index_dtype, n, offset))
+        offset += index_dtype.itemsize * n
+        counts.append(n)
+    return _triangulate(counts, np.concatenate(chunks)), offset
+
+
+def _read_binary(buffer, offset, elements, order):
+    data = {}
+    for element in elements:
+        if not element.has_lists():
+            dtype = element.dtype(order)
+            data[element.name] = np.frombuffer(buffer, dtype, element.count, offset)
+            offset += dtype.itemsize * element.count
+        elif element.name == "face" and len(element.properties) == 1:
+            data["face"], offset = _binary_faces(buffer, offset, element, order)
+        else:
+            raise ValueError("Unsupported PLY element: %s" % element.name)
+    return data
+
+
+def _read_ascii(text, elements):
+    lines = iter(text.splitlines())
+    data = {}
+    for element in elements:
+        rows = [next(lines) for _ in range(element.count)]
+        if not element.has_lists():
+            dtype = element.dtype("=")
+            values = np.array(" ".join(rows).split(), dtype=np.float64)
+            values = values.reshape(element.count, len(dtype.names))
+            records = np.empty(element.count, dtype)
+            for i, name in enumerate(dtype.names):
+                records[name] = values[:, i]
+            data[element.name] = records
+        elif element.name == "face" and len(element.properties) == 1:
+            counts, indices = [], []
+            for row in rows:
+                values = row.split()
+                counts.append(int(values[0]))
+                indices.extend(values[1 : 1 + int(values[0])])
+            data["face"] = _triangulate(counts, np.array(indices, dtype=np.uint32))
+        else:
+            raise ValueError("Unsupported PLY element: %s" % element.name)
+    return data
+
+
+def _columns(records, names, dtype=np.float32):
+    if records is None or not all(n in records.dtype.names for n in names):
+        return None
+    dtype = np.dtype(dtype)
+    fields = records.dtype.fields
+    first = fields[names[0]][1]
+    if all(
+        fields[n][0] == dtype and fields[n][1] == first + i * dtype.itemsize
+        for i, n in enumerate(names)
+    ):
+        # Adjacent fields of the expected type: a strided view, no copy
+        return np.lib.stride_tricks.as_strided(
+            records[names[0]],
+            shape=(len(records), len(names)),
+            strides=(records.strides[0], dtype.itemsize),
+            writeable=False,
+        )
+    return np.stack([records[n] for n in names], axis=1).astype(dtype)
+
+
+def _mesh_arrays(data):
+    vertices = data.get("vertex")
+    if vertices is None:
+        raise ValueError("PLY file has no vertex element")
+    faces = data.get("face")
+    if faces is None:
+        faces = np.empty((0, 3), np.uint32)
+    elif faces.dtype in (np.dtype(np.int32), np.dtype(np.uint32)):
+        faces = faces.view(np.uint32)
+    else:
+        faces = faces.astype(np.uint32)
+    mesh = {
+        "vertices": _columns(vertices, ("x", "y", "z")),
+        "faces": faces,
+    }
+    normals = _columns(vertices, ("nx", "ny", "nz"))
+    uvs = _columns(vertices, ("s", "t"))
+    if uvs is None:
+        uvs = _columns(vertices, ("u", "v"))
+    colors = _columns(vertices, ("red", "green", "blue"))
+    if colors is not None and vertices.dtype["red"].kind == "u":
+        colors = colors / np.float32(np.iinfo(vertices.dtype["red"]).max)
+    alphas = None
+    if "alpha" in vertices.dtype.names:
+        alphas = vertices["alpha"]
+        if alphas.dtype.kind == "u":
+            alphas = alphas / np.float32(np.iinfo(alphas.dtype).max)
+        alphas = alphas.astype(np.float32, copy=False)
+    for key, value in (
+        ("normals", normals),
+        ("uvs", uvs),
+        ("colors", colors),
+        ("alphas", alphas),
+    ):
+        if value is not None:
+            mesh[key] = value
+    return mesh
+
+
+def read_ply(path, mmap=True):
+    """Read a triangle mesh from a PLY file.
+
+    Return a dict of numpy arrays suitable for define_mesh: "vertices",
+    "faces" (polygons are fan-triangulated), and if present "normals",
+    "uvs", "colors" and "alphas". Integer colors are normalized to [0, 1].
+
+    Binary files are memory-mapped unless `mmap` is False, and the arrays
+    are then read-only views on the file where possible (float32 vertex
+    data and triangle indices in native byte order). These views reflect
+    later changes of the file, and accessing them after the file is
+    truncated crashes the process: use mmap=False for arrays that outlive
+    the read. ASCII files are read and parsed in memory.
+    """
+    with open(path, "rb") as f:
+        fmt, elements, offset = _read_header(f)
+        if fmt == "ascii":
+            content = f.read().decode("ascii")
+        elif mmap:
+            content = np.memmap(f, dtype=np.uint8, mode="r")
+        else:
+            f.seek(0)
+            content = f.read()
+    if fmt == "ascii":
+        data = _read_ascii(content, elements)
+    else:
+        data = _read_binary(content, offset, elements, _BYTE_ORDERS[fmt])
+    return _mesh_arrays(data)
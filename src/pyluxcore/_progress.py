@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Render session progress: halt conditions, waiting and iteration."""
+
+import time
+
+# Longest interval between two statistics updates while waiting, in
+# seconds; waits are shorter when a condition can tell when it will be met
+DEFAULT_INTERVAL = 1.0
+
+# Shortest interval, when a condition is estimated to be met right away
+_MIN_INTERVAL = 0.01
+
+
+def pass_count(passes):
+    """Condition met when the session has rendered `passes` passes."""
+
+    def condition(stats):
+        return stats.Get("stats.renderengine.pass").GetInt() >= passes
+
+    def remaining(stats):
+        # From the average pass rate so far
+        done = stats.Get("stats.renderengine.pass").GetInt()
+        elapsed = stats.Get("stats.renderengine.time").GetFloat()
+        if done <= 0 or elapsed <= 0.0:
+            return None
+        return (passes - done) * elapsed / done
+
+    condition.remaining = remaining
+    return condition
+
+
+def convergence(threshold):
+    """Condition met when the session convergence reaches `threshold`.
+
+    Convergence is a ratio between 0.0 and 1.0.
+    """
+
+    def condition(stats):
+        return stats.Get("stats.renderengine.convergence").GetFloat() >= threshold
+
+    return condition
+
+
+def halt_time(seconds):
+    """Condition met when the session has rendered for `seconds`."""
+
+    def condition(stats):
+        return stats.Get("stats.renderengine.time").GetFloat() >= seconds
+
+    def remaining(stats):
+        return seconds - stats.Get("stats.renderengine.time").GetFloat()
+
+    condition.remaining = remaining
+    return condition
+
+
+def any_of(*conditions):
+    """Condition met when at least one of `conditions` is met."""
+
+    def condition(stats):
+        return any(c(stats) for c in conditions)
+
+    def remaining(stats):
+        estimates = [_estimate(c, stats) for c in conditions]
+        return None if None in estimates else min(estimates)
+
+    condition.remaining = remaining
+    return condition
+
+
+def _fetch_stats(session):
+    session.UpdateStats()
+    return session.GetStats()
+
+
+def _estimate(condition, stats):
+    # Estimated seconds until `condition` is met, None if unknown
+    remaining = getattr(condition, "remaining", None)
+    return None if remaining is None else remaining(stats)
+
+
+def _delay(condition, stats, interval):
+    # Time to sleep before the next check: until the condition is
+    # estimated to be met, at most `interval`
+    estimate = None if condition is None else _estimate(condition, stats)
+    if estimate is None:
+        return interval
+    return min(interval, max(_MIN_INTERVAL, estimate))
+
+
+def wait_for(session, condition=None, timeout=None, interval=DEFAULT_INTERVAL,
+             callback=None):
+    """Block until `condition` is met or the session is done.
+
+    `condition` is a callable taking session statistics (a Properties
+    object) and returning a boolean; None waits for the session own halt
+    conditions only. `callback`, if any, is called with the statistics
+    at each update.
+
+    Statistics are updated every `interval` seconds at most. Conditions
+    made by pass_count, halt_time and any_of estimate when they will be
+    met, from the render time and pass rate, and the wait is shortened
+    to that estimate. Lower `interval` for a tighter polling of other
+    conditions.
+
+    Return the last statistics if the condition is met or the session is
+    done, None if `timeout` (in seconds) expired first.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        stats = _fetch_stats(session)
+        if callback is not None:
+            callback(stats)
+        if (condition is not None and condition(stats)) or session.HasDone():
+            return stats
+        delay = _delay(condition, stats, interval)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0.0:
+                return None
+            delay = min(delay, remaining)
+        time.sleep(delay)
+
+
+def progress(session, interval=1.0, until=None):
+    """Iterate over session statistics, every `interval` seconds.
+
+    Iteration stops after yielding the statistics that meet `until`, or
+    when the session is done.
+    """
+    while True:
+        time.sleep(interval)
+        stats = _fetch_stats(session)
+        yield stats
+        if (until is not None and until(stats)) or session.HasDone():
+            return
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Bulk access to Property and Properties."""
+
+import bisect
+
+import numpy as np
+
+_TRUE_STRINGS = frozenset(("1", "true", "yes", "on"))
+
+
+def _select(values, width, stride, offset):
+    # Take `width` consecutive items out of every `stride` items, starting
+    # at `offset`; return a (count, width) array, or values if width is None
+    values = values[offset:]
+    if width is None:
+        return values
+    if stride is None:
+        stride = width
+    if width < 1 or stride < width:
+        raise ValueError("Expected 1 <= width <= stride")
+    if len(values) < width:
+        return values[:0].reshape(0, width)
+    count = (len(values) - width) // stride + 1
+    if stride == width:
+        return values[: count * width].reshape(count, width)
+    indices = np.arange(count)[:, np.newaxis] * stride + np.arange(width)
+    return values[indices]
+
+
+def _add_all(prop, values, dtype, width, stride, offset):
+    values = np.asarray(values, dtype=dtype).reshape(-1)
+    return prop.Add(_select(values, width, stride, offset).reshape(-1).tolist())
+
+
+def add_all_float(prop, values, width=None, stride=None, offset=0):
+    """Append floats from a numpy array (or any sequence) to `prop`.
+
+    Starting at `offset`, `width` consecutive values are taken out of
+    every `stride` values (all values if `width` is None). Return `prop`.
+
+    float32 arrays are handed to the native Property.AddAllFloat as a
+    buffer, after selection; other inputs go through a Python list.
+    """
+    if isinstance(values, np.ndarray) and values.dtype == np.float32:
+        values = _select(values.reshape(-1), width, stride, offset)
+        prop.AddAllFloat(np.ascontiguousarray(values).reshape(-1))
+        return prop
+    return _add_all(prop, values, np.float64, width, stride, offset)
+
+
+def add_all_int(prop, values, width=None, stride=None, offset=0):
+    """Append integers to `prop` (see add_all_float)."""
+    return _add_all(prop, values, np.int64, width, stride, offset)
+
+
+def add_all_uint(prop, values, width=None, stride=None, offset=0):
+    """Append unsigned integers to `prop` (see add_all_float)."""
+    return _add_all(prop, values, np.uint64, width, stride, offset)
+
+
+def add_all_bool(prop, values, width=None, stride=None, offset=0):
+    """Append booleans to `prop` (see add_all_float)."""
+    return _add_all(prop, values, np.bool_, width, stride, offset)
+
+
+def _get_all(prop, dtype, width, stride, offset):
+    values = prop.Get()
+    if dtype == np.bool_:
+        values = [
+            v.lower() in _TRUE_STRINGS if isinstance(v, str) else bool(v)
+            for v in values
+        ]
+    values = np.array(values, dtype=dtype).reshape(-1)
+    return _select(values, width, stride, offset)
+
+
+def get_all_float(prop, width=None, stride=None, offset=0, dtype=np.float64):
+    """Return the values of `prop` as a numpy float array.
+
+    Values are read in one call. With `width`, `width` consecutive values
+    are taken out of every `stride` values from `offset`, and a
+    (count, width) array is returned; otherwise a flat array.
+    """
+    return _get_all(prop, dtype, width, stride, offset)
+
+
+def get_all_int(prop, width=None, stride=None, offset=0, dtype=np.int64):
+    """Return the values of `prop` as a numpy integer array.
+
+    See get_all_float.
+    """
+    return _get_all(prop, dtype, width, stride, offset)
+
+
+def get_all_uint(prop, width=None, stride=None, offset=0, dtype=np.uint64):
+    """Return the values of `prop` as a numpy unsigned array.
+
+    See get_all_float.
+    """
+    return _get_all(prop, dtype, width, stride, offset)
+
+
+def get_all_bool(prop, width=None, stride=None, offset=0):
+    """Return the values of `prop` as a numpy boolean array.
+
+    See get_all_float.
+    """
+    return _get_all(prop, np.bool_, width, stride, offset)
+
+
+def _prefix_end(prefix):
+    # Smallest string greater than all strings starting with prefix
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PropertiesIndex:
+    """Prefix index over the names of a Properties object.
+
+    The index is a snapshot, built from one GetAllNames call: a sorted
+    name list answers prefix queries by bisection (names() returns
+    sorted names, not in definition order), and a tree of name
+    components answers unique sub-name queries. Query costs depend on the
+    result size, not on the total number of names. Call update() after
+    the Properties object has changed.
+    """
+
+    def __init__(self, props):
+        self.update(props)
+
+    def update(self, props):
+        """Rebuild the index from `props`."""
+        names = props.GetAllNames()
+        self._sorted = sorted(names)
+        self._tree = {}
+        for name in names:
+            node = self._tree
+            for component in name.split("."):
+                node = node.setdefault(component, {})
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def __contains__(self, name):
+        i = bisect.bisect_left(self._sorted, name)
+        return i < len(self._sorted) and self._sorted[i] == name
+
+    def names(self, prefix=""):
+        """Return the names starting with `prefix`, in sorted order.
+
+        Unlike GetAllNames, which keeps definition order, names are
+        returned sorted, as stored in the index.
+        """
+        if not prefix:
+            return list(self._sorted)
+        lo = bisect.bisect_left(self._sorted, prefix)
+        hi = bisect.bisect_left(self._sorted, _prefix_end(prefix), lo)
+        return self._sorted[lo:hi]
+
+    def unique_sub_names(self, prefix):
+        """Return the unique names one level below `prefix`.
+
+        For instance, "film.outputs" gives "film.outputs.1",
+        "film.outputs.2"... (see GetAllUniqueSubNames), in definition
+        order.
+        """
+        node = self._tree
+        for component in prefix.split("."):
+            node = node.get(component)
+            if node is None:
+                return []
+        return [prefix + "." + component for component in node]
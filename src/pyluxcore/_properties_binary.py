@@ -0,0 +1,313 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Binary serialization of Properties.
+
+Values of each key are stored as one run in a typed array, picked from
+the key's values: booleans, 32 or 64-bit integers, 32 or 64-bit floats
+(32 bits whenever lossless), or string indices. Numeric strings, such as
+the values of properties parsed from text, are stored as numbers when
+their text is restored exactly by Python's repr; they are loaded back
+as strings. Keys mixing types (or holding blobs) fall back to a tagged
+64-bit payload per value.
+
+File layout (little endian):
+- magic (8 bytes), then header length (uint64);
+- JSON header, giving offset, dtype and length of each section;
+- sections, 8-byte aligned, relative to the end of the padded header:
+  - "strings": NUL-separated UTF-8 strings (key prefixes, key leaves and
+    string values are interned there);
+  - "keys.prefix", "keys.leaf": string indices of each key, split at its
+    last dot (prefix is _NO_PREFIX for dotless keys);
+  - "keys.kind", "keys.count": run kind (index in _KINDS, or _MIXED)
+    and value count of each key; runs of a kind follow each other in
+    key order;
+  - "values.<kind>": the typed runs of each kind;
+  - "mixed.tag", "mixed.payload": type and 64-bit payload of each value
+    of mixed keys (booleans and integers as is, floats as IEEE bits,
+    strings and blobs as indices);
+  - "blobs.offsets", "blobs.data": blob contents.
+
+Sections are read through a memory map, without intermediate copies.
+"""
+
+import json
+import mmap
+
+import numpy as np
+
+from .pyluxcore import Properties, Property
+
+_MAGIC = b"LXPROPS\x00"
+_VERSION = 2
+_NO_PREFIX = 0xFFFFFFFF
+
+# Run kinds and their dtypes; ".text" kinds are numeric strings
+_KINDS = (
+    ("bool", "u1"),
+    ("int32", "<i4"),
+    ("int64", "<i8"),
+    ("float32", "<f4"),
+    ("float64", "<f8"),
+    ("string", "<u4"),
+    ("int32.text", "<i4"),
+    ("int64.text", "<i8"),
+    ("float32.text", "<f4"),
+    ("float64.text", "<f8"),
+)
+_KIND_INDEX = {name: i for i, (name, _) in enumerate(_KINDS)}
+_MIXED = len(_KINDS)
+
+# Value tags of mixed keys
+_BOOL, _INT, _FLOAT, _STRING, _BLOB, _BIGINT = range(6)
+
+
+class _Strings:
+    # Interned string table
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, string):
+        i = self.ids.get(string)
+        if i is None:
+            i = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return i
+
+
+def _ints(values, suffix=""):
+    if all(-(2**31) <= v < 2**31 for v in values):
+        return "int32" + suffix, np.array(values, dtype=np.int32)
+    if all(-(2**63) <= v < 2**63 for v in values):
+        return "int64" + suffix, np.array(values, dtype=np.int64)
+    return None
+
+
+def _floats(values, suffix=""):
+    array = np.array(values, dtype=np.float64)
+    narrow = array.astype(np.float32)
+    with np.errstate(invalid="ignore"):
+        lossless = bool((narrow == array).all())
+    if lossless:
+        return "float32" + suffix, narrow
+    return "float64" + suffix, array
+
+
+def _numbers(strings):
+    # Typed run of numeric strings that repr() restores exactly, or None
+    for kind, typed in ((int, _ints), (float, _floats)):
+        try:
+            values = [kind(s) for s in strings]
+        except ValueError:
+            continue
+        if all(repr(v) == s for v, s in zip(values, strings)):
+            return typed(values, ".text")
+    return None
+
+
+class _Encoder:
+    def __init__(self):
+        self.strings = _Strings()
+        self.runs = {name: [] for name, _ in _KINDS}
+        self.tags = []
+        self.payloads = []
+        self.blobs = []
+
+    def add_values(self, prop):
+        # Store the values of a property, return (kind, count)
+        values = prop.Get()
+        run = self._typed(values) if values else None
+        if run is not None:
+            name, array = run
+            self.runs[name].append(array)
+            return _KIND_INDEX[name], len(array)
+        for i, value in enumerate(values):
+            tag, payload = self._encode(prop, i, value)
+            self.tags.append(tag)
+            self.payloads.append(payload)
+        return _MIXED, len(values)
+
+    def _typed(self, values):
+        types = set(map(type, values))
+        if types == {bool}:
+            return "bool", np.array(values, dtype=np.uint8)
+        if types == {int}:
+            return _ints(values)
+        if types == {float}:
+            return _floats(values)
+        if types == {str}:
+            run = _numbers(values)
+            if run is None:
+                run = "string", np.array(
+                    [self.strings.add(v) for v in values], dtype=np.uint32
+                )
+            return run
+        return None
+
+    def _encode(self, prop, index, value):
+        kind = type(value)
+        if kind is bool:
+            return _BOOL, int(value)
+        if kind is int:
+            if -(2**63) <= value < 2**63:
+                return _INT, value
+            return _BIGINT, self.strings.add(str(value))
+        if kind is float:
+            return _FLOAT, int(np.array(value, dtype=np.float64).view(np.int64))
+        if kind is str:
+            return _STRING, self.strings.add(value)
+        self.blobs.append(bytes(prop.GetBlob(index)))
+        return _BLOB, len(self.blobs) - 1
+
+
+def save_properties_binary(props, path):
+    """Save `props` to `path` in binary format."""
+    encoder = _Encoder()
+    names = props.GetAllNames()
+    prefixes = np.empty(len(names), dtype=np.uint32)
+    leaves = np.empty(len(names), dtype=np.uint32)
+    kinds = np.empty(len(names), dtype=np.uint8)
+    counts = np.empty(len(names), dtype=np.uint32)
+    for i, name in enumerate(names):
+        prefix, dot, leaf = name.rpartition(".")
+        prefixes[i] = encoder.strings.add(prefix) if dot else _NO_PREFIX
+        leaves[i] = encoder.strings.add(leaf)
+        kinds[i], counts[i] = encoder.add_values(props.Get(name))
+
+    def concat(arrays, dtype):
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+    blob_offsets = np.zeros(len(encoder.blobs) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoder.blobs], out=blob_offsets[1:])
+    sections = {
+        "strings": np.frombuffer(
+            "\x00".join(encoder.strings.strings).encode("utf-8"), dtype=np.uint8
+        ),
+        "keys.prefix": prefixes,
+        "keys.leaf": leaves,
+        "keys.kind": kinds,
+        "keys.count": counts,
+    }
+    for name, dtype in _KINDS:
+        sections["values." + name] = concat(encoder.runs[name], dtype)
+    sections.update(
+        {
+            "mixed.tag": np.array(encoder.tags, dtype=np.uint8),
+            "mixed.payload": np.array(encoder.payloads, dtype=np.int64),
+            "blobs.offsets": blob_offsets,
+            "blobs.data": np.frombuffer(b"".join(encoder.blobs), dtype=np.uint8),
+        }
+    )
+
+    layout = {}
+    offset = 0
+    for key, array in sections.items():
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        sections[key] = array
+        layout[key] = [offset, array.dtype.str, len(array)]
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(
+        {"version": _VERSION, "count": len(names), "sections": layout}
+    ).encode("utf-8")
+
+    with open(path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        base = _align(f.tell())
+        for key, array in sections.items():
+            f.write(b"\x00" * (base + layout[key][0] - f.tell()))
+            f.write(array.tobytes())
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _mixed_values(sections, strings):
+    tags = sections["mixed.tag"]
+    payloads = sections["mixed.payload"]
+    values = np.empty(len(tags), dtype=object)
+    for tag, convert in (
+        (_BOOL, lambda p: (p != 0).tolist()),
+        (_INT, lambda p: p.tolist()),
+        (_FLOAT, lambda p: p.view(np.float64).tolist()),
+        (_STRING, lambda p: [strings[i] for i in p.tolist()]),
+        (_BIGINT, lambda p: [int(strings[i]) for i in p.tolist()]),
+    ):
+        mask = tags == tag
+        if mask.any():
+            values[mask] = convert(payloads[mask])
+    blob_offsets = sections["blobs.offsets"].tolist()
+    blob_data = sections["blobs.data"]
+    for i in np.flatnonzero(tags == _BLOB).tolist():
+        b = int(payloads[i])
+        values[i] = bytearray(blob_data[blob_offsets[b] : blob_offsets[b + 1]])
+    return values.tolist()
+
+
+def _run_values(name, array, strings):
+    # Whole section of a kind, as a list of Python values
+    if name == "bool":
+        return (array != 0).tolist()
+    if name == "string":
+        return [strings[i] for i in array.tolist()]
+    if name.endswith(".text"):
+        return list(map(repr, array.tolist()))
+    return array.tolist()
+
+
+def _decode(buffer, props):
+    if bytes(buffer[:8]) != _MAGIC:
+        raise ValueError("Not a binary properties file")
+    length = int.from_bytes(buffer[8:16], "little")
+    header = json.loads(bytes(buffer[16 : 16 + length]).decode("utf-8"))
+    if header["version"] != _VERSION:
+        raise ValueError("Unsupported binary properties version")
+    base = _align(16 + length)
+    sections = {
+        key: np.frombuffer(buffer, dtype=dtype, count=count, offset=base + offset)
+        for key, (offset, dtype, count) in header["sections"].items()
+    }
+
+    strings = bytes(sections["strings"]).decode("utf-8").split("\x00")
+    runs = [
+        _run_values(name, sections["values." + name], strings) for name, _ in _KINDS
+    ]
+    runs.append(_mixed_values(sections, strings))
+
+    # Start of each run in the section of its kind
+    kinds = sections["keys.kind"]
+    counts = sections["keys.count"].astype(np.int64)
+    starts = np.empty(len(counts), dtype=np.int64)
+    for kind in np.unique(kinds).tolist():
+        mask = kinds == kind
+        starts[mask] = np.cumsum(counts[mask]) - counts[mask]
+    ends = starts + counts
+
+    names = [
+        strings[leaf] if prefix == _NO_PREFIX else strings[prefix] + "." + strings[leaf]
+        for prefix, leaf in zip(
+            sections["keys.prefix"].tolist(), sections["keys.leaf"].tolist()
+        )
+    ]
+    for name, kind, start, end in zip(
+        names, kinds.tolist(), starts.tolist(), ends.tolist()
+    ):
+        props.Set(Property(name, runs[kind][start:end]))
+    return props
+
+
+def load_properties_binary(path, props=None):
+    """Load properties saved by save_properties_binary.
+
+    Properties are added to `props` if given, to a new Properties object
+    otherwise. Return the Properties object.
+    """
+    if props is None:
+        props = Properties()
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return _decode(buffer, props)
@@ -0,0 +1,180 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Scene definition from numpy arrays."""
+
+import numpy as np
+
+from .pyluxcore import Properties, Property
+
+# Object ID letting LuxCore pick one
+_NULL_ID = 0xFFFFFFFF
+
+
+def _array(name, values, dtype, columns, rows=None):
+    # Check and normalize a per-element array, returns None if values is None
+    if values is None:
+        return None
+    # No copy for arrays of the right type, even strided ones (mmap views)
+    array = np.asarray(values, dtype=dtype)
+    if columns is None:
+        array = array.reshape(-1)
+    else:
+        array = array.reshape(-1, columns)
+    if rows is not None and len(array) != rows:
+        raise ValueError(
+            "'%s' has %d elements, %d expected" % (name, len(array), rows)
+        )
+    return array
+
+
+_TUPLES_CHUNK = 1 << 16
+
+
+def _tuples(array):
+    # Convert by chunks, so that the intermediate nested lists stay small
+    if array is None:
+        return None
+    tuples = []
+    for start in range(0, len(array), _TUPLES_CHUNK):
+        tuples.extend(map(tuple, array[start : start + _TUPLES_CHUNK].tolist()))
+    return tuples
+
+
+def to_luxcore_matrix(matrix):
+    """Convert a 4x4 (row-major, column vectors) matrix to a LuxCore list.
+
+    LuxCore expects transformations as 16 floats in column-major order.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32).reshape(4, 4)
+    return matrix.T.ravel().tolist()
+
+
+def define_mesh(scene, name, vertices, faces, normals=None, uvs=None,
+                colors=None, alphas=None, transformation=None):
+    """Define a triangle mesh shape in `scene` from numpy arrays.
+
+    - vertices: (N, 3) positions;
+    - faces: (M, 3) vertex indices;
+    - normals: optional (N, 3) per-vertex normals;
+    - uvs: optional (N, 2) texture coordinates;
+    - colors: optional (N, 3) per-vertex colors;
+    - alphas: optional (N,) per-vertex alphas;
+    - transformation: optional 4x4 matrix applied to the mesh (see
+      to_luxcore_matrix).
+
+    Arrays are converted to float32 (uint32 for faces) and handed to
+    Scene.DefineMesh in one call, without going through text properties.
+    Scene.DefineMesh takes lists of tuples, built by chunks from the
+    arrays: peak memory is dominated by these lists (about 150 bytes per
+    vertex or face), whatever the arrays are views on. The shape can then
+    be referenced by objects as `name`.
+    """
+    vertices = _array("vertices", vertices, np.float32, 3)
+    count = len(vertices)
+    faces = _array("faces", faces, np.uint32, 3)
+    if faces.size and faces.max() >= count:
+        raise ValueError("'faces' refers to vertices out of range")
+    normals = _array("normals", normals, np.float32, 3, count)
+    uvs = _array("uvs", uvs, np.float32, 2, count)
+    colors = _array("colors", colors, np.float32, 3, count)
+    alphas = _array("alphas", alphas, np.float32, None, count)
+
+    scene.DefineMesh(
+        name,
+        _tuples(vertices),
+        _tuples(faces),
+        _tuples(normals),
+        _tuples(uvs),
+        _tuples(colors),
+        None if alphas is None else alphas.tolist(),
+        None if transformation is None else to_luxcore_matrix(transformation),
+    )
+
+
+def define_strands(scene, name, points, segments, thickness=0.025,
+                   transparency=0.0, colors=(1.0, 1.0, 1.0), uvs=None,
+                   tessellation="ribbon", adaptive_max_depth=0,
+                   adaptive_error=0.0, solid_side_count=0,
+                   solid_cap_bottom=False, solid_cap_top=False,
+                   use_camera_position=True):
+    """Define a strands (hair) shape in `scene` from numpy arrays.
+
+    - points: (N, 3) control points, strand after strand;
+    - segments: (S,) segment count of each strand (uint16), each strand
+      having segments + 1 points;
+    - thickness, transparency: a scalar, or a (N,) per-point array;
+    - colors: a RGB triple, or a (N, 3) per-point array;
+    - uvs: None, a (u, v) pair, or a (N, 2) per-point array.
+
+    Other arguments are the tessellation settings of Scene.DefineStrands.
+    """
+    points = _array("points", points, np.float32, 3)
+    count = len(points)
+    segments = _array("segments", segments, np.uint16, None)
+    expected = int(segments.sum(dtype=np.int64)) + len(segments)
+    if expected != count:
+        raise ValueError(
+            "'segments' describes %d points, %d given" % (expected, count)
+        )
+
+    def per_point(argname, value, columns):
+        # Scalar (or single tuple) values are passed through as is
+        if np.ndim(value) == (0 if columns is None else 1):
+            return float(value) if columns is None else tuple(map(float, value))
+        array = _array(argname, value, np.float32, columns, count)
+        return array.tolist() if columns is None else _tuples(array)
+
+    scene.DefineStrands(
+        name,
+        len(segments),
+        count,
+        _tuples(points),
+        segments.tolist(),
+        per_point("thickness", thickness, None),
+        per_point("transparency", transparency, None),
+        per_point("colors", colors, 3),
+        None if uvs is None else per_point("uvs", uvs, 2),
+        tessellation,
+        adaptive_max_depth,
+        adaptive_error,
+        solid_side_count,
+        solid_cap_bottom,
+        solid_cap_top,
+        use_camera_position,
+    )
+
+
+def define_instances(scene, name, shape, material, transforms, ids=None):
+    """Define instances of a shape in `scene`, one per transformation.
+
+    - shape, material: names of an existing shape and material;
+    - transforms: (N, 4, 4) matrices (see to_luxcore_matrix);
+    - ids: optional (N,) object IDs, otherwise chosen by LuxCore.
+
+    A template object is defined, duplicated N times by one call to
+    Scene.DuplicateObject, then deleted: instances share the shape data.
+    Objects are named `name` followed by their index ("name0",
+    "name1"...).
+    """
+    transforms = np.asarray(transforms, dtype=np.float32).reshape(-1, 4, 4)
+    count = len(transforms)
+    # Column-major matrices, back to back
+    matrices = np.ascontiguousarray(transforms.transpose(0, 2, 1)).reshape(-1)
+    if ids is None:
+        ids = np.full(count, _NULL_ID, dtype=np.uint32)
+    else:
+        ids = _array("ids", ids, np.uint32, None, count)
+    ids = np.ascontiguousarray(ids)
+
+    template = name + "__template"
+    prefix = "scene.objects." + template
+    props = Properties()
+    props.Set(Property(prefix + ".shape", [shape]))
+    props.Set(Property(prefix + ".material", [material]))
+    scene.Parse(props)
+    try:
+        scene.DuplicateObject(template, name, count, matrices, ids)
+    finally:
+        scene.DeleteObject(template)
@@ -0,0 +1,271 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Scheduling of concurrent render sessions on one host."""
+
+import itertools
+import os
+import time
+
+from .pyluxcore import Properties, Property, RenderSession
+from ._progress import DEFAULT_INTERVAL, _delay, _fetch_stats
+
+# Job states
+QUEUED = "queued"  # Waiting for admission
+READY = "ready"  # Session created, not started yet
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+
+_ADMITTED = (READY, RUNNING, PAUSED)
+
+
+def _available_memory():
+    # Memory available to new allocations, in bytes, None if unknown
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class RenderJob:
+    """A render job of a SessionScheduler (see SessionScheduler.submit).
+
+    `state` is one of "queued", "ready", "running", "paused", "done" and
+    "cancelled". `session` is the RenderSession once the job is admitted,
+    `stats` the last statistics, and `run_time` the wall time the job
+    spent running, in seconds.
+    """
+
+    def __init__(self, config, name, priority, threads, memory, until):
+        self.config = config
+        self.name = name
+        self.priority = priority
+        self.threads = threads
+        self.memory = memory
+        self.until = until
+        self.state = QUEUED
+        self.session = None
+        self.stats = None
+        self.run_time = 0.0
+        self._resumed = None  # Time of the last start or resume
+        self._scheduled = 0.0  # Same, kept for round robin ordering
+
+    def __repr__(self):
+        return "<RenderJob %r %s>" % (self.name, self.state)
+
+    def _run(self, now):
+        if self.state == READY:
+            self.session.Start()
+        else:
+            self.session.Resume()
+        self.state = RUNNING
+        self._resumed = self._scheduled = now
+
+    def _pause(self, now):
+        self.session.Pause()
+        self.state = PAUSED
+        self.run_time += now - self._resumed
+
+    def _stop(self, state, now):
+        if self.state == RUNNING:
+            self.run_time += now - self._resumed
+        if self.state in (RUNNING, PAUSED):
+            self.session.Stop()
+        self.state = state
+
+
+class SessionScheduler:
+    """Share the cores of a host among several render sessions.
+
+    - Each job renders with a fixed number of native threads (the
+      "native.threads.count" property), and running jobs never use more
+      than `threads` threads in total (default: all cores).
+    - Jobs are admitted, that is their session is created, while their
+      declared memory fits in `memory` bytes (if given) and in the memory
+      currently available on the host, and while fewer than
+      `max_sessions` sessions exist.
+    - Admitted jobs run in priority order, as long as their threads fit
+      in the budget. Jobs that do not fit take turns with jobs of the
+      same or lower priority, every `time_slice` seconds, by pausing and
+      resuming their sessions.
+
+    `jobs` lists the jobs not finished yet.
+
+    Call run() to drive the jobs to completion, or step() periodically
+    from an existing loop. run() polls statistics every `interval`
+    seconds at most, and wakes up earlier at the end of a time slice or
+    when a job halt condition is estimated to be met (see wait_for).
+    """
+
+    def __init__(self, threads=None, memory=None, max_sessions=None,
+                 time_slice=2.0, interval=DEFAULT_INTERVAL):
+        self.threads = threads or os.cpu_count() or 1
+        self.memory = memory
+        self.max_sessions = max_sessions
+        self.time_slice = time_slice
+        self.interval = interval
+        self.jobs = []
+        self._counter = itertools.count()
+        self._slice_end = None
+
+    def submit(self, config, priority=0, threads=None, memory=0, until=None,
+               name=None):
+        """Queue a job rendering `config` (a RenderConfig), return it.
+
+        - priority: jobs with higher values run first;
+        - threads: native threads of the session (default: all of the
+          scheduler threads);
+        - memory: estimated memory use of the session, in bytes, for
+          admission control;
+        - until: halt condition taking session statistics (see
+          pass_count, halt_time...), in addition to the session own halt
+          conditions.
+        """
+        threads = min(threads or self.threads, self.threads)
+        if self.memory is not None and memory > self.memory:
+            raise ValueError("Job memory exceeds the scheduler memory budget")
+        if name is None:
+            name = "job%d" % next(self._counter)
+        job = RenderJob(config, name, priority, threads, memory, until)
+        self.jobs.append(job)
+        self._slice_end = None
+        return job
+
+    def cancel(self, job):
+        """Stop a job, which is then dropped from the scheduler."""
+        if job.state in (DONE, CANCELLED):
+            return
+        job._stop(CANCELLED, time.monotonic())
+        self.jobs.remove(job)
+        self._slice_end = None
+
+    def close(self):
+        """Cancel all jobs."""
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def step(self):
+        """Run one scheduling round; return the jobs finished by it."""
+        now = time.monotonic()
+        finished = self._poll(now)
+        admitted = self._admit()
+        if finished or admitted or self._slice_end is None or now >= self._slice_end:
+            self._schedule(now)
+            self._slice_end = now + self.time_slice
+        return finished
+
+    def run(self, timeout=None, callback=None):
+        """Drive all jobs to completion.
+
+        `callback`, if any, is called with each job as soon as it is
+        finished. Return True when all jobs are done, False if `timeout`
+        (in seconds) expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.jobs:
+            for job in self.step():
+                if callback is not None:
+                    callback(job)
+            if not self.jobs:
+                break
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            delay = self._delay()
+            if self._slice_end is not None:
+                delay = min(delay, self._slice_end - now)
+            if deadline is not None:
+                delay = min(delay, deadline - now)
+            time.sleep(max(0.0, delay))
+        return True
+
+    def _delay(self):
+        # Until the first running job is estimated to finish
+        delay = self.interval
+        for job in self.jobs:
+            if job.state == RUNNING and job.stats is not None:
+                delay = min(delay, _delay(job.until, job.stats, self.interval))
+        return delay
+
+    def _poll(self, now):
+        finished = []
+        for job in self.jobs:
+            if job.state != RUNNING:
+                continue
+            job.stats = _fetch_stats(job.session)
+            if (job.until is not None and job.until(job.stats)) or (
+                job.session.HasDone()
+            ):
+                job._stop(DONE, now)
+                finished.append(job)
+        for job in finished:
+            self.jobs.remove(job)
+        return finished
+
+    def _admit(self):
+        admitted = [job for job in self.jobs if job.state in _ADMITTED]
+        committed = sum(job.memory for job in admitted)
+        available = None
+        result = []
+        for job in self._by_priority(QUEUED):
+            if self.max_sessions is not None and len(admitted) >= self.max_sessions:
+                break
+            if self.memory is not None and committed + job.memory > self.memory:
+                break
+            if job.memory:
+                if available is None:
+                    available = _available_memory()
+                if available is not None and job.memory > available:
+                    break
+                if available is not None:
+                    available -= job.memory
+            # The thread count of a session is fixed at creation
+            job.config.Parse(
+                Properties().Set(Property("native.threads.count", [job.threads]))
+            )
+            job.session = RenderSession(job.config)
+            job.state = READY
+            committed += job.memory
+            admitted.append(job)
+            result.append(job)
+        return result
+
+    def _by_priority(self, *states):
+        # Highest priority first, then least recently scheduled
+        return sorted(
+            (job for job in self.jobs if job.state in states),
+            key=lambda job: (-job.priority, job._scheduled),
+        )
+
+    def _schedule(self, now):
+        # Greedy fill of the thread budget, in priority order; a job that
+        # was left out is first in line for the next slice
+        selected = []
+        budget = self.threads
+        for job in self._by_priority(*_ADMITTED):
+            if job.threads <= budget:
+                selected.append(job)
+                budget -= job.threads
+        # Pause first, so that resumed sessions find free cores
+        for job in self.jobs:
+            if job.state == RUNNING and job not in selected:
+                job._pause(now)
+        for job in selected:
+            if job.state != RUNNING:
+                job._run(now)
@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""asyncio wrappers for render sessions.
+
+Blocking calls into the bindings (session start/stop, statistics update,
+film I/O...) are run on an executor, so that they do not block the event
+loop, which stays free for other tasks while they run.
+
+The bindings do not release the GIL in most of these calls (Stop,
+SaveFilm, UpdateStats among others): calls made for several sessions at
+once are serialized, and so are Python threads meanwhile. Rendering
+itself runs in native threads and is not affected, so an event loop can
+still monitor several sessions, but their blocking calls do not overlap.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import time
+
+from .pyluxcore import RenderSession, Properties
+from ._progress import DEFAULT_INTERVAL, _delay
+
+
+class AsyncRenderSession:
+    """Awaitable wrapper around a RenderSession.
+
+    Calls on one session are serialized on a dedicated single-thread
+    executor, unless an `executor` is given. The wrapped session is
+    available as `session`.
+    """
+
+    def __init__(self, session, executor=None):
+        self.session = session
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pyluxcore-session"
+            )
+        self._executor = executor
+
+    @classmethod
+    async def create(cls, config, *args, executor=None):
+        """Create the underlying RenderSession off the event loop.
+
+        `args` are passed to RenderSession after `config` (start state and
+        film, for resumed renderings).
+        """
+        owned = executor is None
+        if owned:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pyluxcore-session"
+            )
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(
+            executor, functools.partial(RenderSession, config, *args)
+        )
+        instance = cls(session, executor)
+        instance._owns_executor = owned
+        return instance
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args)
+        )
+
+    async def start(self):
+        await self._run(self.session.Start)
+
+    async def stop(self):
+        await self._run(self.session.Stop)
+
+    async def pause(self):
+        await self._run(self.session.Pause)
+
+    async def resume(self):
+        await self._run(self.session.Resume)
+
+    async def parse(self, props):
+        await self._run(self.session.Parse, props)
+
+    async def update_stats(self):
+        """Update and return the session statistics."""
+
+        def update():
+            self.session.UpdateStats()
+            return self.session.GetStats()
+
+        return await self._run(update)
+
+    async def has_done(self):
+        return await self._run(self.session.HasDone)
+
+    async def wait_for(self, condition=None, timeout=None,
+                       interval=DEFAULT_INTERVAL):
+        """Await `condition` on statistics, or the session being done.
+
+        See pyluxcore.wait_for. Return the last statistics, or None if
+        `timeout` expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = await self.update_stats()
+            if (condition is not None and condition(stats)) or (
+                await self.has_done()
+            ):
+                return stats
+            delay = _delay(condition, stats, interval)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    return None
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    async def stats(self, interval=1.0, until=None):
+        """Asynchronously iterate over statistics (see pyluxcore.progress)."""
+        while True:
+            await asyncio.sleep(interval)
+            stats = await self.update_stats()
+            yield stats
+            if (until is not None and until(stats)) or (await self.has_done()):
+                return
+
+    async def save_film(self, path):
+        """Save the session film (.flm)."""
+        await self._run(lambda: self.session.GetFilm().SaveFilm(path))
+
+    async def save_outputs(self):
+        """Save the film outputs defined in the configuration."""
+        await self._run(lambda: self.session.GetFilm().Save())
+
+    async def save_output(self, path, output_type, props=None):
+        """Save one film output to `path`."""
+        if props is None:
+            props = Properties()
+        await self._run(
+            lambda: self.session.GetFilm().SaveOutput(path, output_type, props)
+        )
+
+    async def save_resume_file(self, path):
+        await self._run(self.session.SaveResumeFile, path)
+
+    def close(self):
+        """Release the executor, if owned by this wrapper."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
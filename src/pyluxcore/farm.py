@@ -0,0 +1,171 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Local render farm: one frame rendered by several processes.
+
+Each worker process renders the same configuration with a different
+seed and saves its film; the films are then merged into one, sample
+weighted. Workers only exchange files, in a work folder.
+
+Usage: pyluxcorefarm <config.cfg> [--workers N] [--threads N]
+                     [--halt-time SECONDS] [--halt-spp SPP]
+                     [--output FILE.flm] [--image FILE] [--work-dir DIR]
+"""
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import pyluxcore
+
+WorkerResult = namedtuple("WorkerResult", ["film", "seed", "passes", "seconds"])
+WorkerResult.__doc__ = "Film file, seed, pass count and render time of a worker."
+
+
+def _render_worker(config_path, overrides, film_path):
+    # Runs in a worker process
+    start = time.perf_counter()
+    pyluxcore.Init()
+    props = pyluxcore.Properties(config_path)
+    for name, values in overrides.items():
+        props.Set(pyluxcore.Property(name, values))
+    config, _ = pyluxcore.load_render_config(props)
+    session = pyluxcore.RenderSession(config)
+    session.Start()
+    try:
+        stats = pyluxcore.wait_for(session, interval=0.5)
+    finally:
+        session.Stop()
+    session.GetFilm().SaveFilm(film_path)
+    return WorkerResult(
+        film_path,
+        overrides["renderengine.seed"][0],
+        stats.Get("stats.renderengine.pass").GetInt(),
+        time.perf_counter() - start,
+    )
+
+
+def _has_halt_condition(config_path):
+    props = pyluxcore.Properties(config_path)
+    return any(
+        props.IsDefined(name) and props.Get(name).GetFloat() > 0.0
+        for name in ("batch.halttime", "batch.haltspp", "batch.haltthreshold")
+    )
+
+
+def render(config_path, workers=None, threads=None, halt_time=None,
+           halt_spp=None, output=None, work_dir=None, seed=1, props=None):
+    """Render a configuration file with `workers` processes.
+
+    - workers: process count (default: 2);
+    - threads: native threads per worker (default: cores / workers);
+    - halt_time: render time of each worker, in seconds;
+    - halt_spp: samples per pixel of the merged film, split among
+      workers;
+    - output: path of the merged .flm file, if it must be saved;
+    - work_dir: folder for worker films (default: a temporary folder);
+    - seed: seed of the first worker, the next ones use the next values;
+    - props: optional dict of extra properties, {name: [values...]}.
+
+    Unless given here, halt conditions must come from the configuration
+    ("batch.*" properties), or workers would never end. Return the merged
+    Film and the WorkerResult list.
+    """
+    config_path = os.fspath(config_path)
+    workers = workers or 2
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    if halt_time is None and halt_spp is None and not _has_halt_condition(
+        config_path
+    ):
+        raise ValueError("No halt condition: set halt_time or halt_spp")
+
+    common = dict(props or {})
+    common["native.threads.count"] = [threads]
+    if halt_time is not None:
+        common["batch.halttime"] = [float(halt_time)]
+    if halt_spp is not None:
+        common["batch.haltspp"] = [int(math.ceil(halt_spp / workers))]
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as folder:
+        jobs = []
+        for i in range(workers):
+            overrides = dict(common)
+            overrides["renderengine.seed"] = [seed + i]
+            jobs.append((overrides, os.path.join(folder, "worker%d.flm" % i)))
+        # Fresh processes: the bindings are not fork-safe once initialized
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            futures = [
+                executor.submit(_render_worker, config_path, overrides, path)
+                for overrides, path in jobs
+            ]
+            results = [future.result() for future in futures]
+        film = pyluxcore.merge_films([r.film for r in results], output)
+    return film, results
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        prog="pyluxcorefarm",
+        description="Render one frame with several local processes.",
+    )
+    parser.add_argument("config", help="render configuration file (.cfg)")
+    parser.add_argument("--workers", type=int, default=2, help="process count")
+    parser.add_argument("--threads", type=int, help="threads per process")
+    parser.add_argument("--halt-time", type=float, help="seconds per process")
+    parser.add_argument("--halt-spp", type=int, help="samples per pixel, total")
+    parser.add_argument("--seed", type=int, default=1, help="first seed")
+    parser.add_argument(
+        "--output", default="farm.flm", help="merged film (default: farm.flm)"
+    )
+    parser.add_argument("--image", help="also save the merged image there")
+    parser.add_argument("--work-dir", help="folder for worker films")
+    args = parser.parse_args(argv)
+
+    pyluxcore.Init()
+    start = time.perf_counter()
+    try:
+        film, results = render(
+            args.config,
+            workers=args.workers,
+            threads=args.threads,
+            halt_time=args.halt_time,
+            halt_spp=args.halt_spp,
+            output=args.output,
+            work_dir=args.work_dir,
+            seed=args.seed,
+        )
+    except ValueError as err:
+        print("Error: %s" % err, file=sys.stderr, flush=True)
+        return 2
+    for result in results:
+        print(
+            "Worker seed %d: %d passes in %.1fs"
+            % (result.seed, result.passes, result.seconds),
+            flush=True,
+        )
+    if args.image:
+        film.SaveOutput(
+            args.image,
+            pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE,
+            pyluxcore.Properties(),
+        )
+    print(
+        "Merged film saved in %s (%.1fs)"
+        % (args.output, time.perf_counter() - start),
+        flush=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Offline evaluation of several image pipelines on a saved film.
+
+The film is loaded once and all pipelines are defined on it; each result
+is written by the background image writers while the next pipeline is
+evaluated.
+
+Usage: pyluxcoreretonemap <film.flm> --pipeline PIPELINE OUTPUT
+                          [--pipeline PIPELINE OUTPUT...]
+
+PIPELINE is a list of stages, e.g. "TONEMAP_LINEAR scale=0.5;
+GAMMA_CORRECTION value=2.2" (see parse_pipeline). OUTPUT is an image
+path, whose extension gives the format (see save_image).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import pyluxcore
+
+# Formats keeping float pixels
+_FLOAT_FORMATS = (".pfm", ".exr")
+
+
+def evaluate_pipelines(film, pipelines):
+    """Evaluate image pipelines on `film`, yield their results.
+
+    `pipelines` is a list of pipelines, each a list of stage dicts (see
+    parse_pipeline). They replace the image pipelines of the film. Each
+    result is a new float32 (height, width, 3) array, rows bottom-up.
+    """
+    film.Parse(pyluxcore.pipeline_properties(pipelines))
+    shape = (film.GetHeight(), film.GetWidth(), 3)
+    for index in range(len(pipelines)):
+        image = np.empty(shape, dtype=np.float32)
+        film.GetOutputFloat(
+            pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, image, index, True
+        )
+        yield image
+
+
+def retonemap(film, pipelines, paths):
+    """Write the results of several pipelines on a film.
+
+    `film` is a Film or a .flm file path, loaded once. `pipelines` and
+    `paths` are matching lists of pipelines (lists of stage dicts) and
+    output image paths. Images are written concurrently, as float for
+    PFM and EXR, as 8 bits per channel otherwise. Return the paths.
+    """
+    if len(pipelines) != len(paths):
+        raise ValueError("Expected one output path per pipeline")
+    if isinstance(film, (str, os.PathLike)):
+        film = pyluxcore.Film(os.fspath(film))
+    futures = []
+    for image, path in zip(evaluate_pipelines(film, pipelines), paths):
+        if os.path.splitext(path)[1].lower() in _FLOAT_FORMATS:
+            image = image[::-1]
+        else:
+            image = pyluxcore.convert_to_display(image, flip=True)
+        futures.append(pyluxcore.save_image(path, image, background=True))
+    return [future.result() for future in futures]
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(
+        prog="pyluxcoreretonemap",
+        description="Evaluate several image pipelines on a saved film.",
+    )
+    parser.add_argument("film", help="film file (.flm)")
+    parser.add_argument(
+        "--pipeline",
+        nargs=2,
+        action="append",
+        required=True,
+        metavar=("PIPELINE", "OUTPUT"),
+        help="pipeline stages and output image, may be repeated",
+    )
+    args = parser.parse_args(argv)
+
+    pyluxcore.Init()
+    start = time.perf_counter()
+    try:
+        pipelines = [pyluxcore.parse_pipeline(text) for text, _ in args.pipeline]
+    except ValueError as err:
+        print("Error: %s" % err, file=sys.stderr, flush=True)
+        return 2
+    film = pyluxcore.Film(args.film)
+    loaded = time.perf_counter()
+    paths = retonemap(film, pipelines, [path for _, path in args.pipeline])
+    for path in paths:
+        print("Saved %s" % path, flush=True)
+    print(
+        "Film loaded in %.2fs, %d pipelines evaluated in %.2fs"
+        % (loaded - start, len(paths), time.perf_counter() - loaded),
+        flush=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,412 @@
+# SPDX-FileCopyrightText: 2024 Howetuft
+#
+# SPDX-License-Identifier: Apache-2.0
+
+"""Micro-benchmarks for pyluxcore bindings.
+
+Usage: pyluxcoretest bench <suite> [<suite>...] [--json FILE]
+                           [--baseline FILE] [--tolerance RATIO]
+
+Each suite returns timings in seconds (best of several runs). Results can
+be saved as JSON and compared against a baseline JSON file: the command
+fails if a timing exceeds its baseline by more than the tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import pyluxcore
+
+
+def Timed(func, *args, repeat=1):
+    """Run func(*args) and return the best elapsed time, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+################################################################################
+## Properties
+################################################################################
+
+
+def ConfigText(objectCount):
+    # A scene description with 4 properties per object
+    lines = []
+    for i in range(objectCount):
+        prefix = "scene.objects.obj%d." % i
+        lines.append(prefix + "material = mat%d" % (i % 100))
+        lines.append(prefix + "ply = meshes/obj%d.ply" % i)
+        lines.append(prefix + "transformation = " + " ".join(["1.0"] * 16))
+        lines.append(prefix + "id = %d" % i)
+    return "\n".join(lines) + "\n"
+
+
+def BenchProperties(objectCount=25000, arraySize=2000000, blobSize=1 << 24):
+    """Time the Property/Properties layer on large inputs."""
+    text = ConfigText(objectCount)
+    props = pyluxcore.Properties()
+    props.SetFromString(text)
+
+    def SetFromString():
+        pyluxcore.Properties().SetFromString(text)
+
+    def Merge():
+        pyluxcore.Properties().Set(props, "prefix.")
+
+    def AddLoop(values):
+        prop = pyluxcore.Property("test.array", [])
+        for v in values:
+            prop.Add([v])
+
+    def BlobRoundTrip(blob):
+        pyluxcore.Property("test.blob", [blob]).GetBlob()
+
+    objectPrefixes = ["scene.objects.obj%d." % i for i in range(0, objectCount, 100)]
+
+    def PrefixQueries():
+        for prefix in objectPrefixes:
+            props.GetAllNames(prefix)
+
+    index = pyluxcore.PropertiesIndex(props)
+
+    def IndexPrefixQueries():
+        for prefix in objectPrefixes:
+            index.names(prefix)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    binaryPath = os.path.join(tmpdir.name, "props.bin")
+    pyluxcore.save_properties_binary(props, binaryPath)
+
+    floats = np.arange(arraySize, dtype=np.float32)
+    floatsList = floats.tolist()
+    arrayProp = pyluxcore.Property("test.array", floatsList)
+    blob = bytearray(blobSize)
+
+    results = {
+        "properties.setfromstring": Timed(SetFromString, repeat=3),
+        "properties.getallnames": Timed(props.GetAllNames, repeat=3),
+        "properties.getallnames.prefix": Timed(
+            props.GetAllNames, "scene.objects.obj1", repeat=3
+        ),
+        "properties.getalluniquesubnames": Timed(
+            props.GetAllUniqueSubNames, "scene.objects", repeat=3
+        ),
+        "properties.getallnames.queries": Timed(PrefixQueries),
+        "properties.index.build": Timed(pyluxcore.PropertiesIndex, props, repeat=3),
+        "properties.index.queries": Timed(IndexPrefixQueries, repeat=3),
+        "properties.index.uniquesubnames": Timed(
+            index.unique_sub_names, "scene.objects", repeat=3
+        ),
+        "properties.set.prefix": Timed(Merge, repeat=3),
+        "properties.binary.save": Timed(
+            pyluxcore.save_properties_binary, props, binaryPath, repeat=3
+        ),
+        "properties.binary.load": Timed(
+            pyluxcore.load_properties_binary, binaryPath, repeat=3
+        ),
+        "properties.blob.roundtrip": Timed(BlobRoundTrip, blob, repeat=3),
+        "property.add.loop": Timed(AddLoop, floatsList[: arraySize // 10]),
+        "property.addallfloat": Timed(
+            lambda: pyluxcore.Property("test.array", []).AddAllFloat(floats),
+            repeat=3,
+        ),
+        "property.add_all_float": Timed(
+            lambda: pyluxcore.add_all_float(pyluxcore.Property("test.array", []), floats),
+            repeat=3,
+        ),
+        "property.add_all_float.stride": Timed(
+            lambda: pyluxcore.add_all_float(
+                pyluxcore.Property("test.array", []), floats, width=3, stride=4
+            ),
+            repeat=3,
+        ),
+        "property.add_all_float.list": Timed(
+            lambda: pyluxcore.add_all_float(
+                pyluxcore.Property("test.array", []), floats.astype(np.float64)
+            ),
+            repeat=3,
+        ),
+        "property.get": Timed(arrayProp.Get, repeat=3),
+        "property.getallfloat": Timed(
+            pyluxcore.get_all_float, arrayProp, repeat=3
+        ),
+    }
+    tmpdir.cleanup()
+    return results
+
+
+################################################################################
+## Strands
+################################################################################
+
+
+def StrandsData(strandsCount, pointsPerStrand):
+    rng = np.random.default_rng(0)
+    roots = rng.random((strandsCount, 1, 3), dtype=np.float32) * 2.0 - 1.0
+    heights = np.linspace(0.0, 1.0, pointsPerStrand, dtype=np.float32)
+    points = np.repeat(roots, pointsPerStrand, axis=1)
+    points[:, :, 2] = heights
+    points = points.reshape(-1, 3)
+    segments = np.full(strandsCount, pointsPerStrand - 1, dtype=np.uint16)
+    thickness = rng.random(len(points), dtype=np.float32) * 0.02 + 0.01
+    return points, segments, thickness
+
+
+def DefineStrandsList(scene, name, points, segments, thickness):
+    # Reference path: Python lists, built point by point
+    pointsList = []
+    for p in points:
+        pointsList.append((float(p[0]), float(p[1]), float(p[2])))
+    segmentsList = [int(s) for s in segments]
+    thicknessList = [float(t) for t in thickness]
+    scene.DefineStrands(
+        name,
+        len(segmentsList),
+        len(pointsList),
+        pointsList,
+        segmentsList,
+        thicknessList,
+        0.0,
+        (1.0, 1.0, 1.0),
+        None,
+        "ribbon",
+        0,
+        0,
+        0,
+        False,
+        False,
+        True,
+    )
+
+
+def BenchStrands(strandsCount=100000, pointsPerStrand=8):
+    """Compare DefineStrands with Python lists against define_strands."""
+    points, segments, thickness = StrandsData(strandsCount, pointsPerStrand)
+    scene = pyluxcore.Scene()
+    return {
+        "strands.list": Timed(
+            DefineStrandsList, scene, "strands_list", points, segments, thickness
+        ),
+        "strands.numpy": Timed(
+            lambda: pyluxcore.define_strands(
+                scene, "strands_numpy", points, segments, thickness=thickness
+            )
+        ),
+    }
+
+
+################################################################################
+## Instances
+################################################################################
+
+
+def InstancesData(instancesCount):
+    rng = np.random.default_rng(0)
+    transforms = np.tile(np.eye(4, dtype=np.float32), (instancesCount, 1, 1))
+    transforms[:, :3, 3] = rng.random((instancesCount, 3), dtype=np.float32) * 100.0
+    return transforms
+
+
+def InstancesScene():
+    scene = pyluxcore.Scene()
+    scene.Parse(
+        pyluxcore.Properties().SetFromString(
+            "scene.materials.mat.type = matte\n"
+            "scene.materials.mat.kd = 0.5 0.5 0.5\n"
+        )
+    )
+    pyluxcore.define_mesh(
+        scene,
+        "tri",
+        [(0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0)],
+        [(0, 1, 2)],
+    )
+    return scene
+
+
+def DefineInstancesProps(scene, transforms):
+    # Reference path: one property block per object
+    props = pyluxcore.Properties()
+    for i, transform in enumerate(transforms):
+        prefix = "scene.objects.obj%d" % i
+        props.Set(pyluxcore.Property(prefix + ".shape", "tri"))
+        props.Set(pyluxcore.Property(prefix + ".material", "mat"))
+        props.Set(
+            pyluxcore.Property(
+                prefix + ".transformation", pyluxcore.to_luxcore_matrix(transform)
+            )
+        )
+    scene.Parse(props)
+
+
+def BenchInstances(instancesCount=100000):
+    """Compare object property blocks against define_instances."""
+    transforms = InstancesData(instancesCount)
+    return {
+        "instances.props": Timed(
+            lambda: DefineInstancesProps(InstancesScene(), transforms)
+        ),
+        "instances.numpy": Timed(
+            lambda: pyluxcore.define_instances(
+                InstancesScene(), "obj", "tri", "mat", transforms
+            )
+        ),
+    }
+
+
+################################################################################
+## PLY
+################################################################################
+
+
+def WritePly(path, vertexCount, faceCount):
+    """Write a random binary little-endian triangle mesh."""
+    rng = np.random.default_rng(0)
+    vertices = np.empty(
+        vertexCount, dtype=[("p", "<f4", 3), ("n", "<f4", 3), ("uv", "<f4", 2)]
+    )
+    vertices["p"] = rng.random((vertexCount, 3), dtype=np.float32)
+    vertices["n"] = (0.0, 0.0, 1.0)
+    vertices["uv"] = vertices["p"][:, :2]
+    faces = np.empty(faceCount, dtype=[("n", "u1"), ("i", "<u4", 3)])
+    faces["n"] = 3
+    faces["i"] = rng.integers(0, vertexCount, (faceCount, 3), dtype=np.uint32)
+    header = "\n".join(
+        [
+            "ply",
+            "format binary_little_endian 1.0",
+            "element vertex %d" % vertexCount,
+        ]
+        + ["property float %s" % n for n in ("x", "y", "z", "nx", "ny", "nz", "s", "t")]
+        + [
+            "element face %d" % faceCount,
+            "property list uchar uint vertex_indices",
+            "end_header",
+        ]
+    )
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii") + b"\n")
+        f.write(vertices.tobytes())
+        f.write(faces.tobytes())
+
+
+def BenchPly(vertexCount=2000000, faceCount=4000000):
+    """Time PLY reading, mesh definition, and native vs cached loading."""
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "mesh.ply")
+        WritePly(path, vertexCount, faceCount)
+        scene = pyluxcore.Scene()
+        sceneProps = (
+            pyluxcore.Properties()
+            .Set(pyluxcore.Property("scene.shapes.mesh.type", ["mesh"]))
+            .Set(pyluxcore.Property("scene.shapes.mesh.ply", [path]))
+        )
+        cache = pyluxcore.AssetCache()
+        return {
+            "ply.loadscene.native": Timed(
+                pyluxcore.load_scene, sceneProps, repeat=3
+            ),
+            # First run decodes, the next ones hit the cache
+            "ply.loadscene.cached": Timed(
+                lambda: pyluxcore.load_scene(
+                    sceneProps, cache=cache, decode_meshes=True
+                ),
+                repeat=3,
+            ),
+            "ply.read.mmap": Timed(pyluxcore.read_ply, path, repeat=3),
+            "ply.read.copy": Timed(
+                lambda: pyluxcore.read_ply(path, mmap=False), repeat=3
+            ),
+            "ply.definemesh": Timed(
+                lambda: pyluxcore.define_mesh(
+                    scene, "mesh", **pyluxcore.read_ply(path)
+                )
+            ),
+        }
+
+
+################################################################################
+
+SUITES = {
+    "instances": BenchInstances,
+    "ply": BenchPly,
+    "properties": BenchProperties,
+    "strands": BenchStrands,
+}
+
+
+def Compare(results, baseline, tolerance):
+    """Print a comparison with baseline and return the regressed keys."""
+    regressions = []
+    for key, value in sorted(results.items()):
+        reference = baseline.get(key)
+        if not reference:
+            print("  %-40s %10.4fs (no baseline)" % (key, value), flush=True)
+            continue
+        ratio = value / reference
+        regressed = ratio > 1.0 + tolerance
+        print(
+            "  %-40s %10.4fs %+7.1f%%%s"
+            % (key, value, (ratio - 1.0) * 100.0, " REGRESSION" if regressed else ""),
+            flush=True,
+        )
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    """Entry point."""
+    parser = argparse.ArgumentParser(prog="pyluxcoretest bench")
+    parser.add_argument("suites", nargs="+", choices=sorted(SUITES))
+    parser.add_argument("--json", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown over baseline, as a ratio (default: 0.25)",
+    )
+    args = parser.parse_args(argv)
+
+    pyluxcore.Init()
+    results = {}
+    for suite in args.suites:
+        print("Benchmark '%s'..." % suite, flush=True)
+        results.update(SUITES[suite]())
+
+    if args.json:
+        report = {
+            "luxcore": pyluxcore.Version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = Compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions: %s" % ", ".join(regressions), flush=True)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
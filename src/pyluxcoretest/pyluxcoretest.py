@@ -18,7 +18,6 @@
 # limitations under the License.
 ################################################################################
 
-import random
 import time
 import sys
 import os
@@ -29,6 +28,8 @@ import shutil
 import subprocess
 import platform
 
+import numpy as np
+
 # sys.path.append("./lib")
 
 import pyluxcore
@@ -166,6 +167,13 @@ def PropertiesTests():
     end = Clock()
     print("AddAllStride test: %.2gs" % (end - start), flush=True)
 
+    prop = pyluxcore.add_all_int(pyluxcore.Property("test.array", []), np.arange(size))
+
+    start = Clock()
+    values = pyluxcore.get_all_int(prop)
+    end = Clock()
+    print("GetAll test (%d values): %.2gs" % (len(values), end - start), flush=True)
+
 
 ################################################################################
 ## LuxRays device information example
@@ -192,23 +200,22 @@ def SimpleRender():
     # Change the render engine to PATHCPU
     props.Set(pyluxcore.Property("renderengine.type", ["PATHCPU"]))
 
-    config = pyluxcore.RenderConfig(props)
+    # Load the scene, prefetching its assets concurrently
+    config, report = pyluxcore.load_render_config(props)
+    for asset in report.assets:
+        print("Asset '%s': %s bytes in %.3fs" % asset, flush=True)
+    print(
+        "Scene loaded (prefetch: %.3fs, parse: %.3fs)"
+        % (report.prefetch, report.parse),
+        flush=True,
+    )
     session = pyluxcore.RenderSession(config)
 
     session.Start()
 
-    startTime = time.time()
-    while True:
-        time.sleep(1)
-
-        elapsedTime = time.time() - startTime
-
+    # Iterate over statistics until 5 seconds of rendering
+    for stats in pyluxcore.progress(session, until=pyluxcore.halt_time(5.0)):
         # Print some information about the rendering progress
-
-        # Update statistics
-        session.UpdateStats()
-
-        stats = session.GetStats()
         print(
             "[Elapsed time: %3d/5sec][Samples %4d][Avg. samples/sec % 3.2fM on %.1fK tris]"
             % (
@@ -223,10 +230,6 @@ def SimpleRender():
             flush=True,
         )
 
-        if elapsedTime > 5.0:
-            # Time to stop the rendering
-            break
-
     session.Stop()
 
     # Save the rendered image
@@ -252,17 +255,13 @@ def GetOutputTest():
     config = pyluxcore.RenderConfig(props)
     session = pyluxcore.RenderSession(config)
 
-    # NOTICE THE DIFFERENT BEHAVIOR REQUIRED BY PYTHON 3.3, 2.7 and 2.6
     filmWidth, filmHeight = config.GetFilmSize()[:2]
-    if sys.version_info < (2, 7, 0):
-        imageBufferFloat = bytearray(filmWidth * filmHeight * 3 * 4)
-        imageBufferUChar = bytearray(filmWidth * filmHeight * 4)
-    elif sys.version_info < (3, 0, 0):
-        imageBufferFloat = buffer(array("f", [0.0] * (filmWidth * filmHeight * 3)))
-        imageBufferUChar = buffer(array("B", [0] * (filmWidth * filmHeight * 4)))
-    else:
-        imageBufferFloat = array("f", [0.0] * (filmWidth * filmHeight * 3))
-        imageBufferUChar = array("B", [0] * (filmWidth * filmHeight * 4))
+    imageBufferUChar = np.empty((filmHeight, filmWidth, 3), dtype=np.uint8)
+
+    # Film outputs are read into pooled numpy buffers, reused at each refresh
+    outputs = pyluxcore.FilmOutputs(session.GetFilm())
+    # Tiles changed since the previous refresh
+    dirtyTiles = pyluxcore.DirtyTiles(tile_size=64)
 
     session.Start()
 
@@ -296,30 +295,14 @@ def GetOutputTest():
         # This is mostly for testing the PyLuxCore functionality, save an image every second
 
         # Update the image
-        session.GetFilm().GetOutputFloat(
-            pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE, imageBufferFloat
-        )
-        pyluxcore.ConvertFilmChannelOutput_3xFloat_To_4xUChar(
-            filmWidth, filmHeight, imageBufferFloat, imageBufferUChar, False
-        )
+        imageBufferFloat = outputs.get(pyluxcore.FilmOutputType.RGB_IMAGEPIPELINE)
+        print("Changed tiles: %d" % len(dirtyTiles.update(imageBufferFloat)), flush=True)
+        pyluxcore.convert_to_display(imageBufferFloat, imageBufferUChar, flip=True)
 
         # Save the imageBufferUChar buffer to a PPM file
         imageFileName = "image" + str(imageIndex) + ".ppm"
         print("Saving image file: " + imageFileName, flush=True)
-        f = open(imageFileName, "w")
-        f.write("P3\n")
-        f.write(str(filmWidth) + " " + str(filmHeight) + "\n")
-        f.write("255\n")
-        for i in range(0, len(imageBufferUChar), 4):
-            f.write(
-                str(imageBufferUChar[i + 2])
-                + " "
-                + str(imageBufferUChar[i + 1])
-                + " "
-                + str(imageBufferUChar[i])
-                + "\n"
-            )
-        f.close()
+        pyluxcore.save_image(imageFileName, imageBufferUChar)
         imageIndex += 1
 
         if elapsedTime > 5.0:
@@ -359,6 +342,12 @@ def ExtractConfiguration():
     for i in ids:
         print("MATERIAL_ID_MASK ID => %d" % i, flush=True)
 
+    # Many queries on the same properties: index the names once
+    index = pyluxcore.PropertiesIndex(props)
+    for root in ("film.outputs", "film.imagepipelines"):
+        for i in index.unique_sub_names(root):
+            print("%s => %s" % (i, ", ".join(index.names(i + "."))), flush=True)
+
     print("Done.", flush=True)
 
 
@@ -367,7 +356,21 @@ def ExtractConfiguration():
 ################################################################################
 
 
-def BuildPlane(objectName, materialName):
+def BuildPlane(scene, objectName, materialName):
+    shapeName = objectName + "_shape"
+    pyluxcore.define_mesh(
+        scene,
+        shapeName,
+        vertices=np.array(
+            [[-1.0, -1.0, 0.0], [-1.0, 1.0, 0.0], [1.0, 1.0, 0.0], [1.0, -1.0, 0.0]],
+            dtype=np.float32,
+        ),
+        faces=np.array([[0, 1, 2], [2, 3, 0]], dtype=np.uint32),
+        uvs=np.array(
+            [[0.0, 0.0], [0.0, 1.0], [1.0, 1.0], [1.0, 0.0]], dtype=np.float32
+        ),
+    )
+
     prefix = "scene.objects." + objectName + "."
     props = pyluxcore.Properties()
     props.SetFromString(
@@ -376,11 +379,9 @@ def BuildPlane(objectName, materialName):
         + materialName
         + "\n"
         + prefix
-        + "vertices = -1.0 -1.0 0.0  -1.0 1.0 0.0  1.0 1.0 0.0  1.0 -1.0 0.0\n"
-        + prefix
-        + "faces = 0 1 2  2 3 0\n"
-        + prefix
-        + "uvs = 0.0 0.0  0.0 1.0  1.0 1.0  1.0 0.0\n"
+        + "shape = "
+        + shapeName
+        + "\n"
     )
 
     return props
@@ -420,9 +421,6 @@ def StrandsRender():
         """
     )
 
-    # Add a plane
-    scnProps.Set(BuildPlane("plane1", "whitematte"))
-
     # Add a distant light source
     scnProps.SetFromString(
         """
@@ -445,34 +443,34 @@ def StrandsRender():
     scene = pyluxcore.Scene()
     scene.Parse(scnProps)
 
+    # Add a plane
+    scene.Parse(BuildPlane(scene, "plane1", "whitematte"))
+
+    # Add a small instanced tile above it, named "tile0"
+    BuildPlane(scene, "tile", "whitematte")
+    tile = np.diag([0.25, 0.25, 0.25, 1.0])
+    tile[:3, 3] = (0.5, 0.5, 0.3)
+    pyluxcore.define_instances(scene, "tile", "tile_shape", "whitematte", [tile])
+
     # Add strands
-    points = []
-    segments = []
     strandsCount = 30
-    for i in range(strandsCount):
-        x = random.random() * 2.0 - 1.0
-        y = random.random() * 2.0 - 1.0
-        points.append((x, y, 0.0))
-        points.append((x, y, 1.0))
-        segments.append(1)
-
-    scene.DefineStrands(
+    roots = np.random.default_rng().random((strandsCount, 2), dtype=np.float32)
+    roots = roots * 2.0 - 1.0
+    points = np.zeros((strandsCount, 2, 3), dtype=np.float32)
+    points[:, :, :2] = roots[:, np.newaxis, :]
+    points[:, 1, 2] = 1.0
+    segments = np.ones(strandsCount, dtype=np.uint16)
+
+    pyluxcore.define_strands(
+        scene,
         "strands_shape",
-        strandsCount,
-        2 * strandsCount,
-        points,
+        points.reshape(-1, 3),
         segments,
-        0.025,
-        0.0,
-        (1.0, 1.0, 1.0),
-        None,
-        "ribbon",
-        0,
-        0,
-        0,
-        False,
-        False,
-        True,
+        thickness=0.025,
+        transparency=0.0,
+        colors=(1.0, 1.0, 1.0),
+        tessellation="ribbon",
+        use_camera_position=True,
     )
 
     strandsProps = pyluxcore.Properties()
@@ -493,18 +491,33 @@ def StrandsRender():
 
     session.Start()
 
-    startTime = time.time()
-    while True:
-        time.sleep(1)
-
-        elapsedTime = time.time() - startTime
+    # New material for the strands, and a lower tile, set after 2 seconds
+    editProps = pyluxcore.Properties()
+    editProps.SetFromString(
+        """
+        scene.materials.redmatte.type = matte
+        scene.materials.redmatte.kd = 0.75 0.0 0.0
+        """
+    )
+    lowerTile = tile.copy()
+    lowerTile[2, 3] = 0.1
+    edited = False
+
+    # Iterate over statistics until 5 seconds of rendering
+    for stats in pyluxcore.progress(session, until=pyluxcore.halt_time(5.0)):
+        if not edited and stats.Get("stats.renderengine.time").GetFloat() >= 2.0:
+            # Edits are applied in order: the material exists when assigned
+            with pyluxcore.SceneEdit(session) as edit:
+                edit.parse(editProps)
+                edit.material("strands_obj", "redmatte")
+                edit.transform("tile0", lowerTile)
+            print(
+                "Scene edit: %s in %.3fs" % (edit.report.changes, edit.report.total),
+                flush=True,
+            )
+            edited = True
 
         # Print some information about the rendering progress
-
-        # Update statistics
-        session.UpdateStats()
-
-        stats = session.GetStats()
         print(
             "[Elapsed time: %3d/5sec][Samples %4d][Avg. samples/sec % 3.2fM on %.1fK tris]"
             % (
@@ -519,10 +532,6 @@ def StrandsRender():
             flush=True
         )
 
-        if elapsedTime > 5.0:
-            # Time to stop the rendering
-            break
-
     session.Stop()
 
     # Save the rendered image
@@ -550,6 +559,16 @@ def ImagePipelineEdit():
 
     session.Start()
 
+    # New image pipeline, its results are read through a cache: the
+    # denoised image is only refreshed every 32 passes
+    pipeline = [
+        {"type": "TONEMAP_REINHARD02"},
+        {"type": "CAMERA_RESPONSE_FUNC", "name": "Ektachrome_320TCD"},
+        {"type": "GAMMA_CORRECTION", "value": 2.2},
+        {"type": "INTEL_OIDN"},
+    ]
+    pipelineCache = None
+
     startTime = time.time()
     imageSaved = False
     while True:
@@ -582,15 +601,11 @@ def ImagePipelineEdit():
             os.rename("normal.png", "normal-edit1.png")
 
             # Define the new image pipeline
+            pipelineCache = pyluxcore.PipelineCache(session, denoise_interval=32)
+            pipelineCache.set_pipeline(pipeline)
             props = pyluxcore.Properties()
             props.SetFromString(
                 """
-                film.imagepipeline.0.type = TONEMAP_REINHARD02
-                film.imagepipeline.1.type = CAMERA_RESPONSE_FUNC
-                film.imagepipeline.1.name = Ektachrome_320TCD
-                film.imagepipeline.2.type = GAMMA_CORRECTION
-                film.imagepipeline.2.value = 2.2
-                film.imagepipeline.3.type = INTEL_OIDN
                 film.noiseestimation.warmup = 20
                 film.noiseestimation.index = 1
                 """
@@ -606,15 +621,35 @@ def ImagePipelineEdit():
 
             imageSaved = True
 
+        if pipelineCache is not None:
+            pipelineCache.get()
+            print(
+                "Pipeline cache: %d hits, %d misses"
+                % (pipelineCache.hits, pipelineCache.misses),
+                flush=True,
+            )
+
         if elapsedTime > 10.0:
             # Time to stop the rendering
             break
 
+    # A trailing exposure change reuses the denoised image
+    pipelineCache.set_pipeline(pipeline + [{"type": "TONEMAP_LINEAR", "scale": 0.5}])
+    image = pipelineCache.get()
+    print(
+        "Pipeline cache: %d hits, %d misses"
+        % (pipelineCache.hits, pipelineCache.misses),
+        flush=True,
+    )
+
     session.Stop()
 
     # Save the rendered image
     session.GetFilm().Save()
     os.rename("normal.png", "normal-edit2.png")
+    pyluxcore.save_image(
+        "normal-edit3.png", pyluxcore.convert_to_display(image, flip=True)
+    )
 
     print("Done.", flush=True)
 
@@ -784,6 +819,17 @@ def SaveResumeRenderingS():
     # Save the session resume file
     session.SaveResumeFile("test.rsm")
 
+    # Save a compressed checkpoint, written in the background
+    with pyluxcore.Checkpointer(session, "checkpoints") as checkpointer:
+        checkpointPath = checkpointer.save().result()
+    print(
+        "Checkpoint: %s (%d bytes, resume file: %d bytes)"
+        % (checkpointPath, os.path.getsize(checkpointPath), os.path.getsize("test.rsm")),
+        flush=True,
+    )
+    info = pyluxcore.checkpoint_info(checkpointPath)
+    print("Checkpoint pass count: %d" % info.passes, flush=True)
+
     # Save the rendered image
     session.GetFilm().Save()
 
@@ -895,8 +941,33 @@ def ExternalOidn():
     print()
 
 
+def InternalOidn():
+    print("*** In-process denoiser test ***")
+    rng = np.random.default_rng(0)
+    image = np.full((256, 256, 3), 0.5, dtype=np.float32)
+    image += rng.normal(0.0, 0.2, image.shape).astype(np.float32)
+    try:
+        pyluxcore.denoise(image)
+    except RuntimeError as err:
+        print("Denoiser not available:", err)
+        return
+    # The device and filter are created by the first call, then reused
+    startTime = time.perf_counter()
+    for _ in range(10):
+        result = pyluxcore.denoise(image)
+    print("Denoise time: %.1fms/frame" % ((time.perf_counter() - startTime) * 100.0))
+    print("Noise std. dev.: %.3f -> %.3f" % (image.std(), result.std()))
+    pyluxcore.release_denoiser()
+    print()
+
+
 def main():
     """Entry point."""
+    if sys.argv[1:2] == ["bench"]:
+        from pyluxcoretest import bench
+
+        sys.exit(bench.main(sys.argv[2:]))
+
     print("STARTING LUXCORETEST", flush=True)
     global PATH_TO_SCENE
     current_path = os.getcwd()
@@ -927,6 +998,7 @@ def main():
         SaveResumeRenderingM()
         SaveResumeRenderingS()
         ExternalOidn()
+        InternalOidn()
 
         print("Copying results", flush=True)
 